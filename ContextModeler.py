@@ -1,59 +1,57 @@
-from arithBase import ProbModel
-import numpy as np
-
-class ContextModeler:
-
-    def __init__(self, block_size: int):
-        self.prob_sig_flag = None
-        self.prob_gt1_flag = None
-        self.prob_level_prefix = None
-        self.prob_cbf = ProbModel()
-        self.prob_last_prefix = ProbModel()
-        self.prediction_mode_bin1 = ProbModel()
-        self.prediction_mode_bin2 = ProbModel()
-        self.prediction_mode_bin3 = ProbModel()
-        self.prediction_inter_flag = ProbModel()
-
-        self.diag_map = self.genDiagMap(block_size)
-        self.models_sig_flag = self.initProbModels(3)
-        self.models_gt1_flag = self.initProbModels(3)
-        self.models_level_prefix = self.initProbModels(3)
-
-        self.prob_mx_abs_greater0_flag = ProbModel()
-        self.prob_mx = ProbModel()
-        self.prob_my_abs_greater0_flag = ProbModel()
-        self.prob_my = ProbModel()
-
-    def initProbModels(self, num):
-        models = []
-        for _ in range(num):
-            models.append(ProbModel())
-        return models
-
-    def genDiagMap(self, block_size):
-        diags = []
-        (rows, columns) = (block_size, block_size)
-        for line in range(1, (rows + columns)):
-
-            start_col = max(0, line - rows)
-            count = min(line, (columns - start_col), rows)
-
-            for j in range(0, count):
-                l = min(rows, line) - j - 1
-                r = start_col + j
-                diags.append(l + r)
-
-        return np.array(diags)
-
-    def switchContext(self, pos):
-        # more or less arbitrary choice of diagonal classes
-        if self.diag_map[pos] < 4:
-            cl = 0
-        elif self.diag_map[pos] < 7:
-            cl = 1
-        else:
-            cl = 2
-
-        self.prob_sig_flag = self.models_sig_flag[cl]
-        self.prob_gt1_flag = self.models_gt1_flag[cl]
-        self.prob_level_prefix = self.models_level_prefix[cl]
+from arithBase import ProbModel
+from ScanTables import get_scan_tables
+
+class ContextModeler:
+
+    def __init__(self, block_size: int):
+        # states of all contexts, indexed by context id (assigned in the order the models are created)
+        self.states = bytearray()
+        self.prob_sig_flag = None
+        self.prob_gt1_flag = None
+        self.prob_level_prefix = None
+        self.prob_cbf = self.newProbModel()
+        self.prob_last_prefix = self.newProbModel()
+        self.prediction_mode_bin1 = self.newProbModel()
+        self.prediction_mode_bin2 = self.newProbModel()
+        self.prediction_mode_bin3 = self.newProbModel()
+        self.prediction_inter_flag = self.newProbModel()
+
+        # context class of each scan position (more or less arbitrary choice of diagonal classes)
+        self.diag_class = get_scan_tables(block_size).diag_class.tolist()
+        self.models_sig_flag = self.initProbModels(3)
+        self.models_gt1_flag = self.initProbModels(3)
+        self.models_level_prefix = self.initProbModels(3)
+
+        self.prob_mx_abs_greater0_flag = self.newProbModel()
+        self.prob_mx = self.newProbModel()
+        self.prob_my_abs_greater0_flag = self.newProbModel()
+        self.prob_my = self.newProbModel()
+
+        # all probability models, e.g. for saving and restoring their states during rate estimation
+        self.models = [self.prob_cbf, self.prob_last_prefix,
+                       self.prediction_mode_bin1, self.prediction_mode_bin2, self.prediction_mode_bin3,
+                       self.prediction_inter_flag,
+                       *self.models_sig_flag, *self.models_gt1_flag, *self.models_level_prefix,
+                       self.prob_mx_abs_greater0_flag, self.prob_mx, self.prob_my_abs_greater0_flag, self.prob_my]
+
+    def initProbModels(self, num):
+        models = []
+        for _ in range(num):
+            models.append(self.newProbModel())
+        return models
+
+    def newProbModel(self):
+        self.states.append(0)
+        return ProbModel(self.states, len(self.states) - 1)
+
+    def saveStates(self):
+        return bytes(self.states)
+
+    def restoreStates(self, states):
+        self.states[:] = states
+
+    def switchContext(self, pos):
+        cl = self.diag_class[pos]
+        self.prob_sig_flag = self.models_sig_flag[cl]
+        self.prob_gt1_flag = self.models_gt1_flag[cl]
+        self.prob_level_prefix = self.models_level_prefix[cl]
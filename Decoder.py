@@ -1,64 +1,72 @@
+import copy
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 
 from EntropyDecoder import EntropyDecoder
 from IBitstream import IBitstream
-from dct import Transformation
+from dct import Transformation, IntegerTransformation
+from quantization import Quantizer, IntegerQuantizer
+from ScanTables import get_scan_tables
+import rawvideo
+import frameindex
+import tiling
+import wavefront
+from ContextModeler import ContextModeler
 from PredictionCalculator import PredictionCalculator
 from PredictionCalculator import PredictionMode
-
-
-def de_diagonalize(arr: np.ndarray) -> np.ndarray:
-    x = 0
-    y = 0
-    x_start = 0
-
-    wx, wy = arr.shape
-    res = np.zeros(arr.shape, dtype=arr.dtype)
-    arr = arr.flatten()
-    for i in range(arr.size):
-        res[y][x] = arr[i]
-        x += 1
-        y -= 1
-        if y < 0 or x >= wx:
-            y = min(x, wx - 1)
-
-            if x >= wx:
-                x_start += 1
-            x = x_start
-    return res
+from PredictionCalculator import INTERPOLATION_FILTERS
 
 
 class Decoder:
 
-    def __init__(self, input_path, output_path, pgm):
+    # output_path may be None if the frames are only passed to frame_callback (e.g. queue.put)
+    # index_path: optional frame index written by the encoder, allows seek() to jump directly to intra frames
+    # n_workers: decode the tiles of intra frames or the block rows (wavefront) in parallel processes
+    def __init__(self, input_path, output_path, pgm, frame_callback=None, index_path=None, n_workers=1):
         self.output_path = output_path
         self.pgm = pgm
+        self.frame_callback = frame_callback
         self.bitstream = IBitstream(input_path)
         self.image_width = self.bitstream.get_bits(16)
         self.image_height = self.bitstream.get_bits(16)
         self.block_size = self.bitstream.get_bits(16)
         self.qp = self.bitstream.get_bits(8)
-        self.qs = 2 ** (self.qp / 4)
+        self.mv_precision = 4 if self.bitstream.get_bit() else 2
+        self.interpolation_filter = INTERPOLATION_FILTERS[self.bitstream.get_bit()]
+        self.intra_period = self.bitstream.get_bits(16)
+        self.tile_columns = self.bitstream.get_bits(8)
+        self.tile_rows = self.bitstream.get_bits(8)
+        self.wavefront = bool(self.bitstream.get_bit())
+        self.sign_grouping = bool(self.bitstream.get_bit())
+        self.integer_transform = bool(self.bitstream.get_bit())
+        self.bitstream.byteAlign()
+        self.first_frame_offset = self.bitstream.tell()
+        self.frame_number = 0  # number of the next frame to be decoded
+        self.frame_offsets = frameindex.read_index(index_path) if index_path else None
         self.pad_height  = self.block_size - self.image_height%self.block_size if self.image_height%self.block_size != 0 else 0
         self.pad_width  = self.block_size - self.image_width%self.block_size if self.image_width%self.block_size != 0 else 0
         self.image = np.zeros([self.image_height + self.pad_height, self.image_width+self.pad_width], dtype=np.uint8)
-        self.image_array = []
-        self.transformation = Transformation(self.block_size)
+        self.ref_image = None  # last decoded frame, the only one kept for prediction
+        self.transformation = (IntegerTransformation(self.block_size) if self.integer_transform
+                               else Transformation(self.block_size))
+        self.quantizer = IntegerQuantizer(self.qp) if self.integer_transform else Quantizer(self.qp)
+        self.scan_tables = get_scan_tables(self.block_size)
+        self.n_workers = n_workers
+        self.tile_executor = None  # process pool for the tiles of intra frames, started with the first tiled frame
+        self.wavefront_buffers = None
+        self.wavefront_executor = None  # process pool for the block rows, started with the first frame
 
     def decode_block_intra_pic(self, x: int, y: int):
         # entropy decoding (EntropyDecoder)
         ent_dec_block, prediction_mode = self.ent_dec.read_block_intra_pic()
 
         # scan unpacking
-        if prediction_mode == PredictionMode.DC_PREDICTION or prediction_mode == PredictionMode.PLANAR_PREDICTION:
-            ordered_block = de_diagonalize(ent_dec_block)
-        elif prediction_mode == PredictionMode.HORIZONTAL_PREDICTION:
-            ordered_block = ent_dec_block.T
-        elif prediction_mode == PredictionMode.VERTICAL_PREDICTION:
-            ordered_block = ent_dec_block
+        ordered_block = self.scan_tables.inverse_scan(ent_dec_block, prediction_mode)
 
         # de-quantization
-        recBlock = ordered_block * self.qs
+        recBlock = self.quantizer.dequantize(ordered_block)
         # idct
         recBlock = self.transformation.backward_transform(recBlock, prediction_mode)
         # adding prediction
@@ -70,9 +78,9 @@ class Decoder:
         # entropy decoding (EntropyDecoder)
         ent_dec_block, inter_flag, dmx, dmy = self.ent_dec.read_block_inter_pic()
         # reverse scanning
-        ordered_block = de_diagonalize(ent_dec_block)
+        ordered_block = self.scan_tables.inverse_scan(ent_dec_block, PredictionMode.DC_PREDICTION)
         # de-quantization
-        recBlock = ordered_block * self.qs
+        recBlock = self.quantizer.dequantize(ordered_block)
         # idct
         recBlock = self.transformation.backward_transform(recBlock, PredictionMode.DC_PREDICTION) # set predMode=DC for correct transform
 
@@ -89,44 +97,82 @@ class Decoder:
         # clipping (0,255) and store to image
         self.image[y:y + self.block_size, x:x + self.block_size] = np.clip(recBlock, 0, 255).astype('uint8')
 
-    # opening and writing a binary file
-    def write_out(self):
-        out_file = open(self.output_path, "wb")
-        if self.pgm:
-            out_file.write(f'P5\n{self.image_width} {self.image_height}\n255\n'.encode())
-        for image in self.image_array:
-            # padding is removed directly before output
-            image = image[:self.image_height,:self.image_width]
-            out_file.write(image.ravel().tobytes())
-        out_file.close()
-        return True
-
     def decode_next_frame_intra(self):
-        self.pred_calc = PredictionCalculator(self.image, self.block_size)
+        self.bitstream.byteAlign()
+        coded_height, coded_width = self.image.shape
+        tiles = tiling.get_tile_rects(coded_width, coded_height, self.block_size, self.tile_columns, self.tile_rows)
+        if self.wavefront:
+            self.decode_frame_wavefront(True)
+        elif len(tiles) == 1:
+            self.decode_intra_tile(self.bitstream, self.image)
+        else:
+            self.decode_intra_tiles(tiles)
+
+        return self.finish_frame()
+
+    # decodes the blocks of an intra tile (or the whole frame) from a new arithmetic codeword into tile
+    def decode_intra_tile(self, bitstream, tile):
+        frame = self.image
+        self.image = tile
+        self.pred_calc = PredictionCalculator(tile, self.block_size)
 
         # start new arithmetic codeword
-        self.ent_dec = EntropyDecoder(self.bitstream, self.block_size)
+        self.ent_dec = EntropyDecoder(bitstream, self.block_size, self.sign_grouping)
 
         # decode blocks
-        for yi in range(0, self.image_height + self.pad_height, self.block_size):
-            for xi in range(0, self.image_width + self.pad_width, self.block_size):
+        for yi in range(0, tile.shape[0], self.block_size):
+            for xi in range(0, tile.shape[1], self.block_size):
                 self.decode_block_intra_pic(xi, yi)
 
         # terminate arithmatic codeword and check whether everything is ok so far
         is_ok = self.ent_dec.terminate()
         if not is_ok:
-            raise Exception('Arithmetic codeword not correctly terminated at end of frame')
+            raise Exception('Arithmetic codeword not correctly terminated at end of tile')
+        self.image = frame
 
-        self.image_array.append(self.image)
-        self.image = np.zeros([self.image_height + self.pad_height, self.image_width + self.pad_width],
-                               dtype=np.uint8)
+    # decodes a tile from its bitstream segment
+    def decode_intra_tile_segment(self, segment, height, width):
+        tile = np.zeros([height, width], dtype=np.uint8)
+        with IBitstream(segment) as bitstream:
+            self.decode_intra_tile(bitstream, tile)
+        return tile
+
+    # byte sizes of all tiles followed by their segments (see Encoder.encode_intra_tiles)
+    def decode_intra_tiles(self, tiles):
+        sizes = [self.bitstream.get_bits(32) for _ in tiles]
+        segments = [bytes(self.bitstream.get_bytes(size)) for size in sizes]
+        heights = [height for _, _, _, height in tiles]
+        widths = [width for _, _, width, _ in tiles]
+        if self.n_workers > 1:
+            if self.tile_executor is None:
+                self.tile_executor = ProcessPoolExecutor(self.n_workers)
+            decoded_tiles = self.tile_executor.map(self.worker_copy().decode_intra_tile_segment,
+                                                   segments, heights, widths)
+        else:
+            decoded_tiles = map(self.decode_intra_tile_segment, segments, heights, widths)
+        for (x, y, width, height), tile in zip(tiles, decoded_tiles):
+            self.image[y:y + height, x:x + width] = tile
+
+    # copy without bitstream, frames, callbacks or process pools that is sent to worker processes
+    def worker_copy(self):
+        decoder = copy.copy(self)
+        decoder.bitstream = decoder.frame_callback = decoder.tile_executor = None
+        decoder.wavefront_buffers = decoder.wavefront_executor = None
+        decoder.image = decoder.ref_image = decoder.pred_calc = decoder.ent_dec = None
+        return decoder
 
     def decode_next_frame_inter(self):
-        padded_last_frame = np.pad(self.image_array[-1], ((self.block_size, self.block_size), (self.block_size, self.block_size)), "edge")
-        self.pred_calc = PredictionCalculator(self.image, self.block_size, padded_last_frame)
+        padded_last_frame = np.pad(self.ref_image, ((self.block_size, self.block_size), (self.block_size, self.block_size)), "edge")
+        if self.wavefront:
+            self.bitstream.byteAlign()
+            self.decode_frame_wavefront(False, padded_last_frame)
+            return self.finish_frame()
+
+        self.pred_calc = PredictionCalculator(self.image, self.block_size, padded_last_frame, self.mv_precision,
+                                              self.interpolation_filter)
 
         # start new arithmetic codeword
-        self.ent_dec = EntropyDecoder(self.bitstream, self.block_size)
+        self.ent_dec = EntropyDecoder(self.bitstream, self.block_size, self.sign_grouping)
 
         # decode blocks
         for yi in range(0, self.image_height + self.pad_height, self.block_size):
@@ -139,13 +185,125 @@ class Decoder:
             raise Exception('Arithmetic codeword not correctly terminated at end of frame')
         
 
-        self.image_array.append(self.image)
+        return self.finish_frame()
+
+    # byte sizes of all block rows followed by their segments (see Encoder.encode_frame_wavefront)
+    def decode_frame_wavefront(self, is_intra, padded_ref=None):
+        coded_height, coded_width = self.image.shape
+        if self.wavefront_buffers is None:
+            self.wavefront_buffers = wavefront.WavefrontBuffers(coded_height, coded_width, self.block_size,
+                                                                len(ContextModeler(self.block_size).models),
+                                                                shared=self.n_workers > 1)
+            if self.n_workers > 1:
+                self.wavefront_executor = wavefront.create_pool(self.wavefront_buffers, self.n_workers)
+        buffers = self.wavefront_buffers
+        sizes = [self.bitstream.get_bits(32) for _ in range(buffers.num_rows)]
+        segments = [bytes(self.bitstream.get_bytes(size)) for size in sizes]
+        buffers.reset()
+
+        if self.wavefront_executor is not None:
+            row_decoder = self.worker_copy()
+            futures = [self.wavefront_executor.submit(row_decoder.decode_wavefront_rows, rows,
+                                                      [segments[row] for row in rows], is_intra, padded_ref)
+                       for rows in wavefront.distribute_rows(buffers.num_rows, self.n_workers)]
+            for future in futures:
+                future.result()
+        else:
+            self.decode_wavefront_rows(range(buffers.num_rows), segments, is_intra, padded_ref)
+        self.image[:] = buffers.frame
+
+    # decodes the given block rows from their segments
+    def decode_wavefront_rows(self, rows, segments, is_intra, padded_ref):
+        # in a worker process the buffers shared with the main process are used
+        buffers = self.wavefront_buffers if self.wavefront_buffers is not None else wavefront.worker_buffers
+        frame = self.image
+        self.image = buffers.frame
+        if is_intra:
+            self.pred_calc = PredictionCalculator(buffers.frame, self.block_size)
+        else:
+            self.pred_calc = PredictionCalculator(buffers.frame, self.block_size, padded_ref, self.mv_precision,
+                                                  self.interpolation_filter)
+        self.pred_calc.mv = buffers.mv
+
+        for row, segment in zip(rows, segments):
+            with IBitstream(segment) as bitstream:
+                # new arithmetic codeword, starting with the context states of the row above
+                self.ent_dec = EntropyDecoder(bitstream, self.block_size, self.sign_grouping)
+                if row > 0:
+                    buffers.wait_for_block(row, 0)
+                    self.ent_dec.cm.restoreStates(buffers.initial_contexts(row))
+
+                yi = row * self.block_size
+                for x_block in range(buffers.blocks_per_row):
+                    buffers.wait_for_block(row, x_block)
+                    if is_intra:
+                        self.decode_block_intra_pic(x_block * self.block_size, yi)
+                    else:
+                        self.decode_block_inter_pic(x_block * self.block_size, yi)
+                    buffers.finish_block(row, x_block, self.ent_dec.cm)
+
+                is_ok = self.ent_dec.terminate()
+                if not is_ok:
+                    raise Exception('Arithmetic codeword not correctly terminated at end of row')
+        self.image = frame
+
+    # the decoded frame becomes the reference frame, returns it (with padding)
+    def finish_frame(self):
+        self.ref_image = self.image
         self.image = np.zeros([self.image_height + self.pad_height, self.image_width + self.pad_width],
-                               dtype=np.uint8)
+                              dtype=np.uint8)
+        return self.ref_image
+
+    # decodes the next frame as intra or inter frame, returns it (with padding)
+    def decode_next_frame(self):
+        if frameindex.is_intra_frame(self.frame_number, self.intra_period):
+            frame = self.decode_next_frame_intra()
+        else:
+            frame = self.decode_next_frame_inter()
+        self.frame_number += 1
+        return frame
 
-    def decode_all_frames(self):
-        self.decode_next_frame_intra()
+    # continue decoding at the given frame: decoding starts at the last intra frame before it, which is reached
+    # through the frame index or (without index) by decoding the frames in between
+    def seek(self, frame_number: int):
+        intra_frame = frameindex.intra_frame_before(frame_number, self.intra_period)
+        if self.frame_offsets is not None and frame_number >= len(self.frame_offsets):
+            raise Exception('Decoder: Frame ' + str(frame_number) + ' not in bitstream')
+        if self.frame_offsets is not None and not intra_frame <= self.frame_number <= frame_number:
+            self.bitstream.seek(self.frame_offsets[intra_frame])
+            self.frame_number = intra_frame
+        elif self.frame_number > frame_number:
+            # without index decoding restarts at the first frame
+            self.bitstream.seek(self.first_frame_offset)
+            self.frame_number = 0
+        # decode the frames up to the requested one (references only)
+        while self.frame_number < frame_number:
+            if self.bitstream.is_EOF():
+                raise Exception('Decoder: Frame ' + str(frame_number) + ' not in bitstream')
+            self.decode_next_frame()
+
+    # yields every frame (padding removed) as soon as it is decoded, the frames are not modified afterwards
+    def frames(self):
         while not self.bitstream.is_EOF():
-            self.decode_next_frame_inter()
-        self.write_out()
+            yield self.decode_next_frame()[:self.image_height, :self.image_width]
+
+    def close(self):
+        self.bitstream.close()
+        if self.tile_executor is not None:
+            self.tile_executor.shutdown()
+            self.tile_executor = None
+        if self.wavefront_executor is not None:
+            self.wavefront_executor.shutdown()
+            self.wavefront_executor = None
+
+    # every frame is written as soon as it is decoded
+    # start_frame, n_frames: decode only a part of the sequence (see seek())
+    def decode_all_frames(self, start_frame=0, n_frames=None):
+        if start_frame:
+            self.seek(start_frame)
+        with rawvideo.FrameWriter(self.output_path, self.image_width, self.image_height, self.pgm,
+                                  self.frame_callback) as frame_writer:
+            for frame in itertools.islice(self.frames(), n_frames):
+                frame_writer.write(frame)
+        self.close()
 
@@ -2,85 +2,99 @@ import numpy as np
 from tqdm import tqdm
 import random
 import math
+import copy
+import collections
+import itertools
+from concurrent.futures import ProcessPoolExecutor
 
 from EntropyEncoder import EntropyEncoder, bitsUsed
 from PredictionCalculator import PredictionCalculator
 from PredictionCalculator import PredictionMode
+from PredictionCalculator import INTERPOLATION_FILTERS
 from OBitstream import OBitstream
-from dct import Transformation
+from ScanTables import get_scan_tables
+from MotionSearch import CostCache, get_search_pattern, pattern_search
+from dct import Transformation, IntegerTransformation
+from quantization import Quantizer, IntegerQuantizer
+import tiling
+import wavefront
+from ContextModeler import ContextModeler
+import netpbm
+import rawvideo
+import frameindex
 
 
 # read PGM image
 def read_image(input_path):
-    with open(input_path, 'rb') as file:
-        header = file.readline()
-        if header != b'P5\n':
-            raise Exception('Encoder: No PGM image')
-        imgSize = file.readline()
-        maxVal = file.readline()
-        if maxVal != b'255\n':
-            raise Exception('Encoder: PGM image has unexpected bit depth')
-        width, height = str(imgSize).split(' ')
-        width = int(width[2:])
-        height = int(height[:len(height) - 3])
-        # create image and read data
-        image = np.zeros([height, width], dtype=np.uint8)
-        for h in range(0, height):
-            for w in range(0, width):
-                byte = file.read(1)
-                if not byte:
-                    raise Exception('Encoder: PGM image is corrupted')
-                image[h, w] = byte[0]
-        return image
-
-
-def read_video(input_path, width, height, n_frames):
-    with open(input_path, 'rb') as file:
-        n_bytes = width * height * n_frames
-        frames = file.read(n_bytes)
-    _frames = np.frombuffer(frames, dtype='uint8')
-    _frames = _frames.reshape(n_frames, height, width)
-
-    return _frames
-
-
-def sort_diagonal(mat: np.ndarray) -> np.ndarray:
-    res = []
-    (rows, columns) = mat.shape
-    for line in range(1, (rows + columns)):
-
-        start_col = max(0, line - rows)
-        count = min(line, (columns - start_col), rows)
-
-        for j in range(0, count):
-            res.append(mat[min(rows, line) - j - 1][start_col + j])
-    return np.array(res)
+    image, header = netpbm.read_image(input_path)
+    if header.magic != b'P5':
+        raise Exception('Encoder: No PGM image')
+    if header.maxval != 255:
+        raise Exception('Encoder: PGM image has unexpected bit depth')
+    return image
 
 
 class Encoder:
 
-    def __init__(self, input_path, output_path, block_size, QP, fast_search, reconstruction_path=None):
+    def __init__(self, input_path, output_path, block_size, QP, fast_search, reconstruction_path=None,
+                 full_search_engine='batched', search_pattern='log', quarter_sample=False,
+                 interpolation_filter='bilinear', exact_rate_estimation=True, frame_callback=None,
+                 tile_columns=1, tile_rows=1, wavefront=False, sign_grouping=False, integer_transform=False):
         self.input_path = input_path
         self.output_path = output_path
         self.block_size = block_size
         self.qp = QP
         self.qs = 2 ** (self.qp / 4)
         self.image_reconstructed = None
-        self.image_reconstructed_array = []
         self.entropyEncoder = None
         self.reconstruction_path = reconstruction_path
+        self.frame_callback = frame_callback  # called with every reconstructed frame (e.g. queue.put)
         self.raw_video = False
-        self.transformation = Transformation(block_size)
+        self.integer_transform = integer_transform  # integer transform and quantization (see IntegerTransformation)
+        self.transformation = IntegerTransformation(block_size) if integer_transform else Transformation(block_size)
+        self.quantizer = IntegerQuantizer(QP) if integer_transform else Quantizer(QP)
+        self.scan_tables = get_scan_tables(block_size)
         self.search_range = 0
         self.rmv = []
+        self.rmv_array = None
         self.fast_search = fast_search
-
-    def init_obitstream(self, img_height, img_width, path):
+        self.full_search_engine = full_search_engine
+        self.sad_volume = None
+        self.search_pattern = search_pattern
+        self.search_stages = None
+        self.search_stats = {'blocks': 0, 'evaluated': 0, 'lookups': 0}
+        self.quarter_sample = quarter_sample
+        self.mv_precision = 4 if quarter_sample else 2  # motion vectors in units of 1/mv_precision samples
+        self.interpolation_filter = interpolation_filter
+        self.exact_rate_estimation = exact_rate_estimation
+        self.frame_offsets = []  # byte position of each coded frame in the bitstream
+        self.tile_columns = tile_columns  # partitioning of intra frames into tiles (see tiling)
+        self.tile_rows = tile_rows
+        self.tile_executor = None  # process pool for the tiles of intra frames
+        self.wavefront = wavefront  # code the block rows in wavefront order (see wavefront)
+        self.wavefront_buffers = None
+        self.wavefront_executor = None  # process pool for the block rows
+        self.wavefront_workers = 1
+        self.padded_rec_img = None
+        self.sign_grouping = sign_grouping  # signs of all coefficients of a block after its levels
+        if wavefront and tile_columns * tile_rows > 1:
+            raise Exception('Encoder: Tiles and wavefront processing cannot be combined')
+
+    # intra_period: every intra_period-th frame is an intra frame (0: only the first frame)
+    def init_obitstream(self, img_height, img_width, path, intra_period=0):
         outputBitstream = OBitstream(path)
         outputBitstream.addBits(img_width, 16)
         outputBitstream.addBits(img_height, 16)
         outputBitstream.addBits(self.block_size, 16)
         outputBitstream.addBits(self.qp, 8)
+        outputBitstream.addBit(self.quarter_sample)
+        outputBitstream.addBit(INTERPOLATION_FILTERS.index(self.interpolation_filter))
+        outputBitstream.addBits(intra_period, 16)
+        outputBitstream.addBits(self.tile_columns, 8)
+        outputBitstream.addBits(self.tile_rows, 8)
+        outputBitstream.addBit(self.wavefront)
+        outputBitstream.addBit(self.sign_grouping)
+        outputBitstream.addBit(self.integer_transform)
         return outputBitstream
 
     def set_image_size(self, width, height):
@@ -93,115 +107,277 @@ class Encoder:
         self.image = np.pad(self.image, ((0, self.pad_height), (0, self.pad_width)), "edge")
 
     # Gets an image and return an encoded bitstream.
-    def encode_image(self):
+    # n_workers: encode the tiles or block rows (wavefront) in parallel processes
+    def encode_image(self, n_workers=1):
         self.image = read_image(self.input_path)
         self.set_image_size(width=self.image.shape[1], height=self.image.shape[0])
 
         # open bitstream and write header
         self.outputBitstream = self.init_obitstream(self.image_height, self.image_width, self.output_path)
 
-        self.encode_frame_intra(show_frame_progress=True)
+        if n_workers > 1 and self.wavefront:
+            self.start_wavefront_pool(n_workers)
+            try:
+                self.encode_frame_intra(show_frame_progress=True)
+            finally:
+                self.stop_wavefront_pool()
+        elif n_workers > 1 and self.tile_columns * self.tile_rows > 1:
+            with ProcessPoolExecutor(n_workers) as self.tile_executor:
+                self.encode_frame_intra(show_frame_progress=True)
+            self.tile_executor = None
+        else:
+            self.encode_frame_intra(show_frame_progress=True)
 
         # terminate bitstream
         self.outputBitstream.terminate()
-        if self.reconstruction_path:
-            self.image_reconstructed_array.append(self.image_reconstructed)
-            self.write_out()
+        frame_writer = self.open_frame_writer()
+        if frame_writer:
+            frame_writer.write(self.image_reconstructed)
+            frame_writer.close()
 
     def calculate_lookup_table(self):
         rmv = []
-        for i in range(4 * self.search_range + 3):
+        # largest difference: integer vector S plus refinement against a predictor of the opposite sign
+        for i in range(2 * self.mv_precision * self.search_range + 2 * self.mv_precision - 1):
             rmv.append(2*bitsUsed(i) +1)
         return rmv
 
-    def encode_video(self, width, height, n_frames, search_range):
+    # input_path may be '-' to read the video from stdin, frames are read one at a time
+    # intra_period: distance of the intra frames (0: only the first frame is an intra frame)
+    # index_path: optional side file with the byte offsets of all frames for random access (see frameindex)
+    # n_workers: encode the block rows (wavefront) or the GOPs (intra frame and following inter frames) in
+    # parallel processes
+    def encode_video(self, width, height, n_frames, search_range, start_frame=0, chroma_format='400',
+                     intra_period=0, index_path=None, n_workers=1):
+        if not 0 <= intra_period < 65536:
+            raise Exception('Encoder: Intra period out of range')
+        if n_workers > 1 and intra_period == 0 and not self.wavefront:
+            raise Exception('Encoder: Parallel encoding requires an intra period')
         self.raw_video = True
-        video = read_video(self.input_path, width, height, n_frames)
+        video = rawvideo.read_frames(self.input_path, width, height, n_frames, start_frame, chroma_format)
         self.set_image_size(width, height)
         self.search_range = search_range
         self.rmv = self.calculate_lookup_table()
+        self.rmv_array = np.array(self.rmv)
+        self.search_stages = get_search_pattern(self.search_pattern, self.search_range)
 
         # open bitstream and write header
-        self.outputBitstream = self.init_obitstream(height, width, self.output_path)
-
-        is_first_frame = True
-        for frame in tqdm(video):
-            self.image = frame
-            if not is_first_frame:
-                self.encode_frame_inter()
-            else:
-                self.encode_frame_intra()
-                is_first_frame = False
+        self.outputBitstream = self.init_obitstream(height, width, self.output_path, intra_period)
+        self.frame_offsets = []
+        # reconstructed frames are written as soon as they are finished, only the reference frame is kept
+        frame_writer = self.open_frame_writer()
 
-            self.padded_rec_img = np.pad(self.image_reconstructed, ((self.block_size, self.block_size), (self.block_size, self.block_size)), "edge")
-
-            self.image_reconstructed_array.append(self.image_reconstructed)
+        if n_workers > 1 and not self.wavefront:
+            self.encode_gops_parallel(video, n_frames, intra_period, n_workers, frame_writer)
+        else:
+            if n_workers > 1:
+                self.start_wavefront_pool(n_workers)
+            try:
+                for frame_number, frame in enumerate(tqdm(video, total=n_frames)):
+                    self.encode_video_frame(frame, frameindex.is_intra_frame(frame_number, intra_period))
+                    if frame_writer:
+                        frame_writer.write(self.image_reconstructed)
+            finally:
+                self.stop_wavefront_pool()
 
         # terminate bitstream
         self.outputBitstream.terminate()
-        if self.reconstruction_path:
-            self.write_out()
+        if frame_writer:
+            frame_writer.close()
+        if index_path:
+            frameindex.write_index(index_path, self.frame_offsets)
+
+    # encodes the next frame of a video, its reconstruction becomes the reference frame
+    def encode_video_frame(self, frame, is_intra):
+        self.image = frame
+        if is_intra:
+            self.encode_frame_intra()
+        else:
+            self.encode_frame_inter()
+
+        self.padded_rec_img = np.pad(self.image_reconstructed, ((self.block_size, self.block_size), (self.block_size, self.block_size)), "edge")
+
+    # Encodes a closed GOP (intra frame followed by inter frames) into a separate in-memory bitstream segment.
+    # Returns the segment, the frame offsets within the segment and the reconstructed frames (if requested).
+    # The segment starts and ends byte aligned like every frame, so appending it to a bitstream gives the same
+    # bytes as the sequential encoding.
+    def encode_gop(self, frames, keep_reconstruction):
+        self.outputBitstream = OBitstream()
+        self.frame_offsets = []
+        reconstructed = []
+        for frame_number, frame in enumerate(frames):
+            self.encode_video_frame(frame, frame_number == 0)
+            if keep_reconstruction:
+                reconstructed.append(self.image_reconstructed[:self.image_height, :self.image_width].copy())
+        self.outputBitstream.terminate()
+        return self.outputBitstream.getvalue(), self.frame_offsets, reconstructed
+
+    # GOPs of intra_period frames are encoded by a pool of n_workers processes (at most 2 * n_workers GOPs are
+    # in flight), their segments are appended to the bitstream in order
+    def encode_gops_parallel(self, video, n_frames, intra_period, n_workers, frame_writer):
+        gop_encoder = self.worker_copy()
+        keep_reconstruction = frame_writer is not None
+
+        progress_bar = tqdm(total=n_frames)
+        pending = collections.deque()
+        with ProcessPoolExecutor(n_workers) as executor:
+            while True:
+                gop = list(itertools.islice(video, intra_period))
+                if not gop:
+                    break
+                pending.append(executor.submit(gop_encoder.encode_gop, gop, keep_reconstruction))
+                if len(pending) >= 2 * n_workers:
+                    self.append_gop_segment(pending.popleft().result(), frame_writer, progress_bar)
+            while pending:
+                self.append_gop_segment(pending.popleft().result(), frame_writer, progress_bar)
+        progress_bar.close()
+
+    def append_gop_segment(self, result, frame_writer, progress_bar):
+        segment, offsets, reconstructed = result
+        self.outputBitstream.byteAlign()
+        segment_offset = self.outputBitstream.tell()
+        self.outputBitstream.addBytes(segment)
+        self.frame_offsets.extend(segment_offset + offset for offset in offsets)
+        for frame in reconstructed:
+            frame_writer.write(frame)
+        progress_bar.update(len(offsets))
+
+    # copy without open files, callbacks or process pools that is sent to worker processes
+    def worker_copy(self):
+        encoder = copy.copy(self)
+        encoder.outputBitstream = None
+        encoder.frame_callback = None
+        encoder.tile_executor = None
+        encoder.wavefront_buffers = encoder.wavefront_executor = None
+        encoder.image = encoder.image_reconstructed = encoder.padded_rec_img = encoder.sad_volume = None
+        encoder.entropyEncoder = encoder.pred_calc = None
+        return encoder
+
+    # process pool for the block rows in wavefront order, the frame buffers are shared with the workers
+    def start_wavefront_pool(self, n_workers):
+        self.wavefront_buffers = wavefront.WavefrontBuffers(self.image_height + self.pad_height,
+                                                            self.image_width + self.pad_width, self.block_size,
+                                                            len(ContextModeler(self.block_size).models), shared=True)
+        self.wavefront_executor = wavefront.create_pool(self.wavefront_buffers, n_workers)
+        self.wavefront_workers = n_workers
+
+    def stop_wavefront_pool(self):
+        if self.wavefront_executor is not None:
+            self.wavefront_executor.shutdown()
+        self.wavefront_executor = None
+        self.wavefront_buffers = None
 
     # If you change this methods pay attention because is used in both encode_image and encode_video() methods
-    # This method should be called for the first frame only
+    # This method should be called for the first frame and every intra_period-th frame only
     def encode_frame_intra(self, show_frame_progress=False):
         # add padding
         self._add_padding()
-        self.image_reconstructed = np.zeros([self.image_height + self.pad_height, self.image_width + self.pad_width],
-                                            dtype=np.uint8)
+        coded_height, coded_width = self.image.shape
 
-        # start new arithmetic codeword for each frame
-        self.entropyEncoder = EntropyEncoder(self.outputBitstream, self.block_size)
+        self.outputBitstream.byteAlign()
+        self.frame_offsets.append(self.outputBitstream.tell())
 
-        # initialize intra prediction calculator
-        self.pred_calc = PredictionCalculator(self.image_reconstructed, self.block_size)
+        progress_bar = tqdm(total=(coded_height // self.block_size) * (coded_width // self.block_size)) \
+            if show_frame_progress else None
+
+        tiles = tiling.get_tile_rects(coded_width, coded_height, self.block_size, self.tile_columns, self.tile_rows)
+        if self.wavefront:
+            self.encode_frame_wavefront(True, progress_bar)
+        elif len(tiles) == 1:
+            self.encode_intra_tile(self.image, self.outputBitstream, progress_bar)
+        else:
+            self.encode_intra_tiles(tiles, progress_bar)
 
         if show_frame_progress:
-            total_blocks = ((self.image_height + self.pad_height) // self.block_size) * (
-                    (self.image_width + self.pad_width) // self.block_size)
-            progress_bar = tqdm(total=total_blocks)
+            progress_bar.close()
+
+    # Encodes the blocks of an intra tile (or the whole frame) with a new arithmetic codeword. The prediction
+    # treats the tile border like the picture border. The reconstructed tile is stored in image_reconstructed.
+    def encode_intra_tile(self, org_tile, bitstream, progress_bar=None):
+        self.image = org_tile
+        self.image_reconstructed = np.zeros(org_tile.shape, dtype=np.uint8)
+
+        # start new arithmetic codeword for each tile
+        self.entropyEncoder = EntropyEncoder(bitstream, self.block_size, self.exact_rate_estimation,
+                                             self.sign_grouping)
+
+        # initialize intra prediction calculator
+        self.pred_calc = PredictionCalculator(self.image_reconstructed, self.block_size)
 
         # process image
         lagrange_multiplier = 0.1 * self.qs * self.qs
-        for yi in range(0, self.image_height + self.pad_height, self.block_size):
-            for xi in range(0, self.image_width + self.pad_width, self.block_size):
-                if show_frame_progress:
+        for yi in range(0, org_tile.shape[0], self.block_size):
+            for xi in range(0, org_tile.shape[1], self.block_size):
+                if progress_bar is not None:
                     progress_bar.update()
 
                 # mode decision
-                cost_mode_tuples = []
-                for pred_mode in PredictionMode:
-                    cost, rec_block, qidx_list = self.test_encode_block_intra_pic(xi, yi, pred_mode, lagrange_multiplier)
-                    cost_mode_tuples.append( (cost, pred_mode, rec_block, qidx_list) )
-                min_cost_mode = min(cost_mode_tuples, key=lambda t: t[0])
-                pred_mode = min_cost_mode[1]
-                rec_block = min_cost_mode[2]
-                qidx_list = min_cost_mode[3]
+                pred_mode, rec_block, qidx_list = self.intra_mode_decision(xi, yi, lagrange_multiplier)
 
                 # encoding using selected mode
                 self.encode_block_intra_pic(xi, yi, rec_block, qidx_list, pred_mode)
 
-        if show_frame_progress:
-            progress_bar.close()
-
         # terminate arithmetic codeword (but keep output bitstream alive)
         self.entropyEncoder.terminate()
 
-    # This method should be called for all frames except the first one
+    # encodes a tile into a separate in-memory bitstream segment, returns the segment and the reconstructed tile
+    def encode_intra_tile_segment(self, org_tile):
+        bitstream = OBitstream()
+        self.encode_intra_tile(org_tile, bitstream)
+        bitstream.terminate()
+        return bitstream.getvalue(), self.image_reconstructed
+
+    # The tiles are encoded separately (in tile_executor if available) and written as
+    #   byte sizes of all tiles (32 bits each), byte aligned segments of all tiles
+    def encode_intra_tiles(self, tiles, progress_bar):
+        frame = self.image
+        reconstructed = np.zeros(frame.shape, dtype=np.uint8)
+        org_tiles = [frame[y:y + height, x:x + width] for x, y, width, height in tiles]
+        if self.tile_executor is not None:
+            results = self.tile_executor.map(self.worker_copy().encode_intra_tile_segment, org_tiles)
+        else:
+            results = map(self.encode_intra_tile_segment, org_tiles)
+
+        segments = []
+        for (x, y, width, height), (segment, rec_tile) in zip(tiles, results):
+            reconstructed[y:y + height, x:x + width] = rec_tile
+            segments.append(segment)
+            if progress_bar is not None:
+                progress_bar.update((width // self.block_size) * (height // self.block_size))
+
+        for segment in segments:
+            self.outputBitstream.addBits(len(segment), 32)
+        for segment in segments:
+            self.outputBitstream.addBytes(segment)
+        self.image = frame
+        self.image_reconstructed = reconstructed
+
+    # This method should be called for all frames except the intra frames
     def encode_frame_inter(self):
         # add padding
         self._add_padding()
 
-        
+        # integer SADs of all blocks for all candidates at once
+        if not self.fast_search and self.full_search_engine == 'volume':
+            self.sad_volume = self.calculate_sad_cost_volume()
+
+        if self.wavefront:
+            self.outputBitstream.byteAlign()
+            self.frame_offsets.append(self.outputBitstream.tell())
+            self.encode_frame_wavefront(False)
+            return
+
         self.image_reconstructed = np.zeros([self.image_height + self.pad_height, self.image_width + self.pad_width],
                                             dtype=np.uint8)
 
         # start new arithmetic codeword for each frame
-        self.entropyEncoder = EntropyEncoder(self.outputBitstream, self.block_size)
+        self.entropyEncoder = EntropyEncoder(self.outputBitstream, self.block_size, self.exact_rate_estimation,
+                                             self.sign_grouping)
+        self.frame_offsets.append(self.outputBitstream.tell())
 
         # initialize intra prediction calculator
         self.pred_calc = PredictionCalculator(self.image_reconstructed, self.block_size,
-                                                    self.padded_rec_img)
+                                              self.padded_rec_img, self.mv_precision, self.interpolation_filter)
 
         # process image
         lagrange_multiplier = 0.1 * self.qs * self.qs
@@ -210,77 +386,112 @@ class Encoder:
 
         for yi in range(0, self.image_height + self.pad_height, self.block_size):
             for xi in range(0, self.image_width + self.pad_width, self.block_size):
-                # estimate motion
-                mxp, myp = self.pred_calc.get_mv_pred(xi, yi)
-                mx, my = self.estimate_motion_vector(xi, yi, mxp, myp, lagrange_root)
-
-                # mode decision between inter and dc mode
-                inter_mode_cost, inter_rec, inter_qidx = self.test_encode_block_inter_pic(lagrange_multiplier, xi, yi, 1, mx, my, mxp, myp)
-                dc_mode_cost, dc_rec, dc_qidx = self.test_encode_block_inter_pic(lagrange_multiplier, xi, yi, 0)
-                if inter_mode_cost < dc_mode_cost:
-                    self.encode_block_inter_pic(xi, yi, inter_rec, inter_qidx, 1, mx, my, mxp, myp)
-                else:
-                    self.encode_block_inter_pic(xi, yi, dc_rec, dc_qidx, 0)
+                self.encode_block_inter(xi, yi, lagrange_multiplier, lagrange_root)
 
         # terminate arithmetic codeword (but keep output bitstream alive)
         self.entropyEncoder.terminate()
 
-    def find_start_mv(self, xi, yi, pred_x_mv, pred_y_mv, lagrange_root):
-        candidates = self.pred_calc.get_start_mv_candidates(xi, yi)
-        candidates = np.append(candidates, [(pred_x_mv, pred_y_mv)], axis=0)
-        candidates = np.sign(candidates) * (np.abs(candidates) // 2)  # round candidates to integer precision (towards zero)
-
-        start_mv = np.zeros(2, dtype='int')
-        min_cost = float('inf')
-        for mv in candidates:
-            if mv[0] >= self.mx_min and mv[0] <= self.mx_max and mv[1] >= self.my_min and mv[1] <= self.my_max:
-                cost = self.get_lagrangian_cost(mv, pred_x_mv, pred_y_mv, xi, yi, lagrange_root)
-                if cost < min_cost:
-                    min_cost = cost
-                    start_mv = mv
-
-        return start_mv
+    def encode_block_inter(self, xi, yi, lagrange_multiplier, lagrange_root):
+        # estimate motion
+        mxp, myp = self.pred_calc.get_mv_pred(xi, yi)
+        mx, my = self.estimate_motion_vector(xi, yi, mxp, myp, lagrange_root)
 
-    def perf_log_step(self, current_x, current_y, center_x_mv, center_y_mv, diamond_size, lagrange_root, pred_x_mv, pred_y_mv):
-        
-        if diamond_size < 1:
-            return (center_x_mv, center_y_mv)
-        
-        # Left motion vector
-        lx_mv = center_x_mv - diamond_size  
-        ly_mv = center_y_mv
-
-        # Right motion vector
-        rx_mv = center_x_mv + diamond_size
-        ry_mv = center_y_mv 
+        # mode decision between inter and dc mode
+        inter_mode_cost, inter_rec, inter_qidx = self.test_encode_block_inter_pic(lagrange_multiplier, xi, yi, 1, mx, my, mxp, myp)
+        dc_mode_cost, dc_rec, dc_qidx = self.test_encode_block_inter_pic(lagrange_multiplier, xi, yi, 0)
+        if inter_mode_cost < dc_mode_cost:
+            self.encode_block_inter_pic(xi, yi, inter_rec, inter_qidx, 1, mx, my, mxp, myp)
+        else:
+            self.encode_block_inter_pic(xi, yi, dc_rec, dc_qidx, 0)
+
+    # Encodes the block rows of a frame in wavefront order (in wavefront_executor if available) and writes them as
+    #   byte sizes of all rows (32 bits each), byte aligned segments of all rows
+    def encode_frame_wavefront(self, is_intra, progress_bar=None):
+        coded_height, coded_width = self.image.shape
+        if self.wavefront_buffers is None:
+            self.wavefront_buffers = wavefront.WavefrontBuffers(coded_height, coded_width, self.block_size,
+                                                                len(ContextModeler(self.block_size).models))
+        buffers = self.wavefront_buffers
+        buffers.reset()
+
+        if self.wavefront_executor is not None:
+            row_encoder = self.worker_copy()
+            row_encoder.image, row_encoder.padded_rec_img, row_encoder.sad_volume = \
+                self.image, self.padded_rec_img, self.sad_volume
+            futures = [self.wavefront_executor.submit(row_encoder.encode_wavefront_rows, rows, is_intra)
+                       for rows in wavefront.distribute_rows(buffers.num_rows, self.wavefront_workers)]
+            segments = {}
+            for future in futures:
+                segments.update(future.result())
+        else:
+            segments = self.encode_wavefront_rows(range(buffers.num_rows), is_intra)
+
+        for row in range(buffers.num_rows):
+            self.outputBitstream.addBits(len(segments[row]), 32)
+        for row in range(buffers.num_rows):
+            self.outputBitstream.addBytes(segments[row])
+        # the buffer is reused for the next frame
+        self.image_reconstructed = buffers.frame.copy()
+        if progress_bar is not None:
+            progress_bar.update(buffers.num_rows * buffers.blocks_per_row)
+
+    # encodes the given block rows, each into its own bitstream segment (returned as dictionary row -> segment)
+    def encode_wavefront_rows(self, rows, is_intra):
+        # in a worker process the buffers shared with the main process are used
+        buffers = self.wavefront_buffers if self.wavefront_buffers is not None else wavefront.worker_buffers
+        self.image_reconstructed = buffers.frame
+        if is_intra:
+            self.pred_calc = PredictionCalculator(buffers.frame, self.block_size)
+        else:
+            self.pred_calc = PredictionCalculator(buffers.frame, self.block_size, self.padded_rec_img,
+                                                  self.mv_precision, self.interpolation_filter)
+        self.pred_calc.mv = buffers.mv
 
-        # Top motion vector
-        tx_mv = center_x_mv
-        ty_mv = center_y_mv + diamond_size
+        lagrange_multiplier = 0.1 * self.qs * self.qs
+        lagrange_root = math.sqrt(lagrange_multiplier)
+        segments = {}
+        for row in rows:
+            # new arithmetic codeword, starting with the context states of the row above
+            bitstream = OBitstream()
+            self.entropyEncoder = EntropyEncoder(bitstream, self.block_size, self.exact_rate_estimation,
+                                                 self.sign_grouping)
+            if row > 0:
+                buffers.wait_for_block(row, 0)
+                self.entropyEncoder.cm.restoreStates(buffers.initial_contexts(row))
+
+            yi = row * self.block_size
+            for x_block in range(buffers.blocks_per_row):
+                buffers.wait_for_block(row, x_block)
+                xi = x_block * self.block_size
+                if is_intra:
+                    pred_mode, rec_block, qidx_list = self.intra_mode_decision(xi, yi, lagrange_multiplier)
+                    self.encode_block_intra_pic(xi, yi, rec_block, qidx_list, pred_mode)
+                else:
+                    self.encode_block_inter(xi, yi, lagrange_multiplier, lagrange_root)
+                buffers.finish_block(row, x_block, self.entropyEncoder.cm)
 
-        # Bottom motion vector
-        bx_mv = center_x_mv
-        by_mv = center_y_mv - diamond_size
+            self.entropyEncoder.terminate()
+            bitstream.terminate()
+            segments[row] = bitstream.getvalue()
+        return segments
 
-        candidates = [(lx_mv, ly_mv), (rx_mv, ry_mv), (tx_mv, ty_mv), (bx_mv, by_mv), (center_x_mv, center_y_mv)]
+    def find_start_mv(self, xi, yi, pred_x_mv, pred_y_mv, cost, bounds):
+        mx_min, my_min, mx_max, my_max = bounds
+        candidates = self.pred_calc.get_start_mv_candidates(xi, yi)
+        candidates = np.append(candidates, [(pred_x_mv, pred_y_mv)], axis=0)
+        candidates = np.sign(candidates) * (np.abs(candidates) // self.mv_precision)  # round candidates to integer precision (towards zero)
 
-        candidates = list(filter(lambda mvs: mvs[0] >= self.mx_min and mvs[0] <= self.mx_max and mvs[1] >= self.my_min and mvs[1] <= self.my_max, candidates))
-        
+        start_mv = (0, 0)
         min_cost = float('inf')
+        for mx, my in candidates.tolist():
+            if mx_min <= mx <= mx_max and my_min <= my <= my_max:
+                cand_cost = cost(mx, my)
+                if cand_cost < min_cost:
+                    min_cost = cand_cost
+                    start_mv = (mx, my)
+
+        return start_mv
 
-        for mv in candidates:
-            cost = self.get_lagrangian_cost(mv, pred_x_mv, pred_y_mv, current_x, current_y, lagrange_root)
-            if cost < min_cost:
-                min_cost = cost
-                min_cost_mv = mv
-            if cost == min_cost and mv[0] == center_x_mv and mv[1] == center_y_mv:
-                min_cost_mv = (center_x_mv, center_y_mv)
-
-        if min_cost_mv[0] == center_x_mv and min_cost_mv[1] == center_y_mv:
-            diamond_size //= 2
-        
-        return self.perf_log_step(current_x, current_y, min_cost_mv[0], min_cost_mv[1], diamond_size, lagrange_root, pred_x_mv, pred_y_mv)
-    
     def get_lagrangian_cost(self, cand_mv, pred_x_mv, pred_y_mv, current_x, current_y, lagrange_root):
 
         cand_block = self.padded_rec_img[current_y + cand_mv[1]  + self.block_size : current_y + cand_mv[1] +  2 * self.block_size,
@@ -289,33 +500,42 @@ class Encoder:
         curr_block = self.image[current_y : current_y + self.block_size, current_x : current_x + self.block_size]
 
         _sad = self.sum_absolute_differences(cand_block, curr_block)
-        diff_mx = abs(2 * cand_mv[0] - pred_x_mv)  # predictors have half-sample precision
-        diff_my = abs(2 * cand_mv[1] - pred_y_mv)
+        diff_mx = abs(self.mv_precision * cand_mv[0] - pred_x_mv)  # predictors have sub-sample precision
+        diff_my = abs(self.mv_precision * cand_mv[1] - pred_y_mv)
         lagrangian_cost = _sad + lagrange_root * (self.rmv[diff_mx] + self.rmv[diff_my])
 
         return lagrangian_cost
 
     def do_log_search(self, xi, yi, pred_x_mv, pred_y_mv, lagrange_root):
+        bounds = self.get_search_window(xi, yi)
+        cost = CostCache(lambda mx, my: self.get_lagrangian_cost((mx, my), pred_x_mv, pred_y_mv, xi, yi, lagrange_root))
 
-        self.mx_min = max(-self.search_range, -(xi + self.block_size))
-        self.my_min = max(-self.search_range, -(yi + self.block_size))
-        self.mx_max = min(self.search_range, self.padded_rec_img.shape[1] - xi - 2 * self.block_size)
-        self.my_max = min(self.search_range, self.padded_rec_img.shape[0] - yi - 2 * self.block_size)
+        start_mx, start_my = self.find_start_mv(xi, yi, pred_x_mv, pred_y_mv, cost, bounds)
+        mv = pattern_search(cost, start_mx, start_my, self.search_stages, bounds)
 
-        start = self.find_start_mv(xi, yi, pred_x_mv, pred_y_mv, lagrange_root)
-
-        return self.perf_log_step(xi, yi, start[0], start[1], 2, lagrange_root, pred_x_mv, pred_y_mv)
+        self.search_stats['blocks'] += 1
+        self.search_stats['evaluated'] += cost.num_evaluated()
+        self.search_stats['lookups'] += cost.lookups
+        return mv
 
     def estimate_motion_vector(self, xi, yi, mxp, myp, lagrange_root):
         # integer motion vector
         if self.fast_search:
             int_mx, int_my = self.do_log_search(xi, yi, mxp, myp, lagrange_root)
+        elif self.full_search_engine == 'volume':
+            int_mx, int_my = self.estimate_integer_motion_vector_from_cost_volume(xi, yi, mxp, myp, lagrange_root)
+        elif self.full_search_engine == 'batched':
+            int_mx, int_my = self.estimate_integer_motion_vector_full_search_batched(xi, yi, mxp, myp, lagrange_root)
         else:
             int_mx, int_my = self.estimate_integer_motion_vector_full_search(xi, yi, mxp, myp, lagrange_root)
 
         # half-sample refinement
         mx, my = self.half_sample_refinement(xi, yi, int_mx, int_my, mxp, myp, lagrange_root)
 
+        # quarter-sample refinement
+        if self.quarter_sample:
+            mx, my = self.subsample_refinement(xi, yi, mx, my, 1, mxp, myp, lagrange_root)
+
         return mx, my
 
     def estimate_integer_motion_vector_full_search(self, xi, yi, mxp, myp, lagrange_root):
@@ -335,8 +555,8 @@ class Encoder:
                 search_block = self.padded_rec_img[yi + _my + self.block_size:yi + _my + 2 * self.block_size,
                            xi + _mx + self.block_size:xi + _mx + 2 * self.block_size]
                 _sad = self.sum_absolute_differences(search_block, current_block)
-                diff_mx = abs(2*_mx - mxp) # pred is half-sample accurate
-                diff_my = abs(2*_my - myp) # while mx/my are sample accurate
+                diff_mx = abs(self.mv_precision*_mx - mxp) # pred is sub-sample accurate
+                diff_my = abs(self.mv_precision*_my - myp) # while mx/my are sample accurate
                 lagrangian_cost = _sad + lagrange_root * (self.rmv[diff_mx] +self.rmv[diff_my])
                 if lagrangian_cost < minimum_lagrangian_cost:
                     minimum_lagrangian_cost = lagrangian_cost
@@ -344,33 +564,102 @@ class Encoder:
                     my = _my
 
         return mx, my
- 
-    def half_sample_refinement(self, xi, yi, integer_mx, integer_my, mxp, myp, lagrange_root):
-        minimum_lagrangian_cost = float('inf')
 
-        int_subsample_mx = 2 * integer_mx
-        int_subsample_my = 2 * integer_my
+    # same result as estimate_integer_motion_vector_full_search, but the SADs of all candidates
+    # are computed at once on sliding-window views of the search area
+    def estimate_integer_motion_vector_full_search_batched(self, xi, yi, mxp, myp, lagrange_root):
+        mx_min, my_min, mx_max, my_max = self.get_search_window(xi, yi)
+
+        current_block = self.image[yi:yi + self.block_size, xi:xi + self.block_size]
+        search_area = self.padded_rec_img[yi + my_min + self.block_size:yi + my_max + 2 * self.block_size,
+                                          xi + mx_min + self.block_size:xi + mx_max + 2 * self.block_size]
+        sad_surface = self.sad_cost_surface(search_area, current_block)
+
+        return self.select_min_cost_mv(sad_surface, mx_min, my_min, mxp, myp, lagrange_root)
+
+    # same result as estimate_integer_motion_vector_full_search, but the SADs are taken from the
+    # cost volume that calculate_sad_cost_volume() computed for the whole frame
+    def estimate_integer_motion_vector_from_cost_volume(self, xi, yi, mxp, myp, lagrange_root):
+        mx_min, my_min, mx_max, my_max = self.get_search_window(xi, yi)
+
+        sad_surface = self.sad_volume[yi // self.block_size, xi // self.block_size,
+                                      my_min + self.search_range:my_max + self.search_range + 1,
+                                      mx_min + self.search_range:mx_max + self.search_range + 1]
 
-        mx_min = int_subsample_mx - 1
-        my_min = int_subsample_my - 1
-        mx_max = int_subsample_mx + 2
-        my_max = int_subsample_my + 2
+        return self.select_min_cost_mv(sad_surface, mx_min, my_min, mxp, myp, lagrange_root)
+
+    def get_search_window(self, xi, yi):
+        mx_min = max(-self.search_range, -(xi + self.block_size))
+        my_min = max(-self.search_range, -(yi + self.block_size))
+        mx_max = min(self.search_range, self.padded_rec_img.shape[1] - xi - 2 * self.block_size)
+        my_max = min(self.search_range, self.padded_rec_img.shape[0] - yi - 2 * self.block_size)
+        return mx_min, my_min, mx_max, my_max
+
+    # adds the motion vector rate to a SAD surface (indexed [my - my_min, mx - mx_min]) and returns the best vector
+    def select_min_cost_mv(self, sad_surface, mx_min, my_min, mxp, myp, lagrange_root):
+        # rate of the motion vector difference (pred is sub-sample accurate, mx/my are sample accurate)
+        mxs = self.mv_precision * np.arange(mx_min, mx_min + sad_surface.shape[1])
+        mys = self.mv_precision * np.arange(my_min, my_min + sad_surface.shape[0])
+        rate_x = self.rmv_array[np.abs(mxs - mxp)]
+        rate_y = self.rmv_array[np.abs(mys - myp)]
+        lagrangian_cost = sad_surface + lagrange_root * (rate_y[:, np.newaxis] + rate_x[np.newaxis, :])
+
+        # argmin returns the first minimum in raster order, like the strict '<' of the loop version
+        my, mx = np.unravel_index(np.argmin(lagrangian_cost), lagrangian_cost.shape)
+        return mx_min + int(mx), my_min + int(my)
+
+    # SAD of block against every block-sized window of search_area, indexed [dy, dx]
+    def sad_cost_surface(self, search_area, block):
+        windows = np.lib.stride_tricks.sliding_window_view(search_area, block.shape)
+        return np.abs(np.subtract(windows, block, dtype=np.int32)).sum(axis=(2, 3))
+
+    # integer SAD of every block of the current frame for every displacement in the search range,
+    # indexed [block row, block column, my + search_range, mx + search_range]
+    def calculate_sad_cost_volume(self):
+        height, width = self.image.shape
+        blocks_y = height // self.block_size
+        blocks_x = width // self.block_size
+        num_mv = 2 * self.search_range + 1
+
+        # displacements beyond the padding are outside the search window anyway,
+        # extend the reference just so that all slices have the same shape
+        extra = max(0, self.search_range - self.block_size)
+        ref = np.pad(self.padded_rec_img, extra, "edge")
+        origin = self.block_size + extra
+
+        volume = np.empty([blocks_y, blocks_x, num_mv, num_mv], dtype=np.int32)
+        for my in range(-self.search_range, self.search_range + 1):
+            rows = ref[origin + my:origin + my + height,
+                       origin - self.search_range:origin + self.search_range + width]
+            # [y, mx, x] view over all horizontal displacements
+            shifted = np.lib.stride_tricks.sliding_window_view(rows, width, axis=1)
+            abs_diff = np.abs(np.subtract(shifted, self.image[:, np.newaxis, :], dtype=np.int32))
+            # box filter: sum each block_size x block_size block
+            block_sad = abs_diff.reshape(blocks_y, self.block_size, num_mv, blocks_x, self.block_size).sum(axis=(1, 4))
+            volume[:, :, my + self.search_range, :] = block_sad.transpose(0, 2, 1)
+        return volume
+
+    def half_sample_refinement(self, xi, yi, integer_mx, integer_my, mxp, myp, lagrange_root):
+        half_sample_step = self.mv_precision // 2
+        return self.subsample_refinement(xi, yi, self.mv_precision * integer_mx, self.mv_precision * integer_my,
+                                         half_sample_step, mxp, myp, lagrange_root)
+
+    # tests the 3x3 sub-sample vectors with distance step around (center_mx, center_my) at once
+    def subsample_refinement(self, xi, yi, center_mx, center_my, step, mxp, myp, lagrange_root):
+        mxs = center_mx + step * np.arange(-1, 2)
+        mys = center_my + step * np.arange(-1, 2)
 
         current_block = self.image[yi:yi + self.block_size, xi:xi + self.block_size]
-        for _my in range(my_min, my_max):
-            for _mx in range(mx_min, mx_max):
-                search_block = self.pred_calc.get_inter_prediction(xi, yi, _mx, _my)
-                _sad = self.sum_absolute_differences(search_block, current_block)
+        search_blocks = self.pred_calc.get_inter_predictions(xi, yi, mxs, mys)
+        sad_surface = np.abs(np.subtract(search_blocks, current_block, dtype=np.int32)).sum(axis=(2, 3))
 
-                diff_mx = abs(_mx - mxp)
-                diff_my = abs(_my - myp)
-                lagrangian_cost = _sad + lagrange_root * (self.rmv[diff_mx] + self.rmv[diff_my])
-                if lagrangian_cost < minimum_lagrangian_cost:
-                    minimum_lagrangian_cost = lagrangian_cost
-                    subsample_mx = _mx
-                    subsample_my = _my
+        rate_x = self.rmv_array[np.abs(mxs - mxp)]
+        rate_y = self.rmv_array[np.abs(mys - myp)]
+        lagrangian_cost = sad_surface + lagrange_root * (rate_y[:, np.newaxis] + rate_x[np.newaxis, :])
 
-        return subsample_mx, subsample_my
+        # first minimum in raster order
+        my, mx = np.unravel_index(np.argmin(lagrangian_cost), lagrangian_cost.shape)
+        return int(mxs[mx]), int(mys[my])
 
     def sum_absolute_differences(self, a, b):
         # Compute the sum of the absolute differences
@@ -378,7 +667,7 @@ class Encoder:
 
     def reconstruct_block(self, pred_block, q_idx_block, x, y, prediction_mode):
         # reconstruct transform coefficients from quantization indexes
-        recBlock = q_idx_block * self.qs
+        recBlock = self.quantizer.dequantize(q_idx_block)
         # invoke 2D Transform inverse
         recBlock = self.transformation.backward_transform(recBlock, prediction_mode)
         # invoke prediction function (see 4.3 DC prediction)
@@ -404,38 +693,39 @@ class Encoder:
         if inter_flag:
             self.pred_calc.store_mv(x, y, mx, my)
 
-    # Calculate lagrangian cost for given block and prediction mode.
-    def test_encode_block_intra_pic(self, x: int, y: int, pred_mode: PredictionMode, lagrange_multiplier):
+    # Test all prediction modes for given block at once and return the one with minimum lagrangian cost.
+    def intra_mode_decision(self, x: int, y: int, lagrange_multiplier):
         # Accessor for current block.
         org_block = self.image[y:y + self.block_size, x:x + self.block_size]
+        pred_modes = np.arange(len(PredictionMode))
 
-        # Prediction, Transform, Quantization.
-        pred_block = self.pred_calc.get_prediction(x, y, pred_mode)
-        pred_error = org_block.astype('int') - pred_block
+        # Prediction, Transform, Quantization of all modes as (modes, B, B) stacks.
+        pred_blocks = self.pred_calc.get_all_predictions(x, y)
+        pred_errors = org_block.astype('int') - pred_blocks
 
-        trans_coeff = self.transformation.forward_transform(pred_error, pred_mode)
+        trans_coeffs = self.transformation.forward_transform_batch(pred_errors, pred_modes)
 
-        q_idx_block = (np.sign(trans_coeff) * np.floor((np.abs(trans_coeff) / self.qs) + 0.4)).astype('int')
+        q_idx_blocks = self.quantizer.quantize(trans_coeffs)
 
-        rec_block = self.reconstruct_block(pred_block, q_idx_block, x, y, pred_mode)
+        rec_residuals = self.transformation.backward_transform_batch(self.quantizer.dequantize(q_idx_blocks), pred_modes)
+        rec_blocks = np.clip(rec_residuals + pred_blocks, 0, 255)
 
         # Distortion calculation using SSD.
-        distortion = np.sum(np.square(np.subtract(org_block, rec_block, dtype='int')))
+        distortions = np.sum(np.square(rec_blocks - org_block), axis=(1, 2))
 
-        if pred_mode == PredictionMode.PLANAR_PREDICTION or pred_mode == PredictionMode.DC_PREDICTION:
-            # diagonal scan
-            scanned_block = sort_diagonal(q_idx_block)
-        elif pred_mode == PredictionMode.HORIZONTAL_PREDICTION:
-            # vertical scan: Transposed block
-            scanned_block = q_idx_block.T
-        elif pred_mode == PredictionMode.VERTICAL_PREDICTION:
-            # horizontal scan: unchanged block
-            scanned_block = q_idx_block
+        # mode dependent scan (diagonal for DC and planar, vertical for horizontal, horizontal for vertical prediction)
+        scanned_blocks = np.take_along_axis(q_idx_blocks.reshape(len(PredictionMode), -1),
+                                            self.scan_tables.mode_scans, axis=1)
 
-        bitrate_estimation = self.entropyEncoder.est_block_bits_intra_pic(pred_mode, scanned_block)
+        # Lagrangian costs, only the bit estimation is done per mode.
+        costs = [distortions[pred_mode] + lagrange_multiplier *
+                 self.entropyEncoder.est_block_bits_intra_pic(pred_mode, scanned_blocks[pred_mode])
+                 for pred_mode in PredictionMode]
+        pred_mode = PredictionMode(int(np.argmin(costs)))
 
-        # Return Lagrangian cost.
-        return distortion + lagrange_multiplier * bitrate_estimation, rec_block, scanned_block
+        # reconstruct selected mode exactly as the decoder does
+        rec_block = self.reconstruct_block(pred_blocks[pred_mode], q_idx_blocks[pred_mode], x, y, pred_mode)
+        return pred_mode, rec_block, scanned_blocks[pred_mode]
 
     # Calculate lagrangian cost for given block: Extent and use later
     def test_encode_block_inter_pic(self, lagrange_multiplier, x: int, y: int, inter_flag: int, mx: int = 0, my: int = 0, mxp: int = 0, myp: int = 0):
@@ -454,7 +744,7 @@ class Encoder:
         trans_coeff = self.transformation.forward_transform(pred_error,
                                                             PredictionMode.DC_PREDICTION)  # set predMode=DC for using correct transform
 
-        q_idx_block = (np.sign(trans_coeff) * np.floor((np.abs(trans_coeff) / self.qs) + 0.4)).astype('int')
+        q_idx_block = self.quantizer.quantize(trans_coeff)
 
         rec_block = self.reconstruct_block(pred_block, q_idx_block, x, y, PredictionMode.DC_PREDICTION)
 
@@ -462,7 +752,7 @@ class Encoder:
         distortion = np.sum(np.square(np.subtract(org_block, rec_block, dtype='int')))
 
         # diagonal scan
-        scanned_block = sort_diagonal(q_idx_block)
+        scanned_block = self.scan_tables.scan(q_idx_block, PredictionMode.DC_PREDICTION)
 
         # Lagrangion cost if all quantization indices 0
         distortion_zeros = np.sum(np.square(np.subtract(org_block, pred_block, dtype='int')))
@@ -479,16 +769,9 @@ class Encoder:
         else:
             return lagrange_zeros, pred_block, zero_block
 
-    # opening and writing a binary file
-    def write_out(self):
-        out_file = open(self.reconstruction_path, "wb")
-        # write PGM header only if input was PGM image
-        if not self.raw_video:
-            out_file.write(f'P5\n{self.image_width} {self.image_height}\n255\n'.encode())
-        # output all reconstructed frames (remove padding just before output)
-        for image_reconstructed in self.image_reconstructed_array:
-            # remove padding
-            image_reconstructed = image_reconstructed[:self.image_height, :self.image_width]
-            out_file.write(image_reconstructed.ravel().tobytes())
-        out_file.close()
-        return True
+    # writer for the reconstructed frames (None if they are neither written nor passed to a callback)
+    def open_frame_writer(self):
+        if self.reconstruction_path is None and self.frame_callback is None:
+            return None
+        return rawvideo.FrameWriter(self.reconstruction_path, self.image_width, self.image_height,
+                                    not self.raw_video, self.frame_callback)
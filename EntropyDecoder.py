@@ -16,10 +16,13 @@ def sign(b):
 
 # class for all the entropy decoding
 class EntropyDecoder:
-    def __init__(self, bitstream: IBitstream, block_size: int):
+    # sign_grouping: the signs of all nonzero coefficients of a block follow its last coefficient
+    # (see EntropyEncoder)
+    def __init__(self, bitstream: IBitstream, block_size: int, sign_grouping: bool = False):
         self.arith_dec = ArithDecoder(bitstream)
         self.cm = ContextModeler(block_size)
         self.block_size = block_size
+        self.sign_grouping = sign_grouping
 
     def read_block_intra_pic(self):
         # read side information
@@ -77,8 +80,18 @@ class EntropyDecoder:
         for k in range(last_scan_index-1, -1, -1):
             out_integer_array[k] = self.readQIndex(k)
 
+        if self.sign_grouping:
+            self.read_signs(out_integer_array, last_scan_index)
+
         return out_integer_array.reshape([self.block_size, self.block_size])
 
+    def read_signs(self, levels, last_scan_index):
+        # signs of all nonzero levels in coding order (last one first) with one bypass read, 1: positive
+        positions = np.flatnonzero(levels[:last_scan_index + 1])[::-1]
+        signs = self.arith_dec.decodeBinsEP(positions.size)
+        negative = np.frombuffer(format(signs, '0%db' % positions.size).encode(), dtype=np.uint8) == ord('0')
+        levels[positions[negative]] *= -1
+
     def readQIndex(self, pos, isLast=False):
         self.cm.switchContext(pos)
 
@@ -89,12 +102,15 @@ class EntropyDecoder:
 
         gt1_flag = self.arith_dec.decodeBin(self.cm.prob_gt1_flag)
         if gt1_flag == 0:
+            if self.sign_grouping:
+                return 1
             sign_flag = self.arith_dec.decodeBinEP()
             return sign(sign_flag)
 
         # (1) read expGolomb for absolute value
         value = self.expGolombProbAdapted(self.cm.prob_level_prefix) + 2
-        value *= sign(self.arith_dec.decodeBinEP())
+        if not self.sign_grouping:
+            value *= sign(self.arith_dec.decodeBinEP())
 
         # (3) return value
         return value
@@ -105,9 +121,7 @@ class EntropyDecoder:
         # (2) read position inside class as fixed-length code of k bits [red bits]
         # (3) return value
 
-        length = 0
-        while not self.arith_dec.decodeBin(prob):
-            length += 1
+        length = self.arith_dec.decodeUnary(prob)
 
         value = 1
         if length > 0:
@@ -1,11 +1,15 @@
 import numpy as np
-import copy
 
 from PredictionCalculator import PredictionMode
 from OBitstream import OBitstream
-from arithBase import ProbModel
+from arithBase import ProbModel, BYPASS
 from arithEncoder import ArithEncoder
 from ContextModeler import ContextModeler
+from RateEstimator import RateEstimator, BIT_SCALE
+
+
+# minimum number of coefficients for the vectorized binarization (fixed numpy overhead per block)
+VECTORIZED_BINARIZATION_MIN = 64
 
 
 def bitsUsed(value: int) -> int:
@@ -19,11 +23,25 @@ def bitsUsed(value: int) -> int:
 
 
 class EntropyEncoder:
-    def __init__(self, bitstream: OBitstream, block_size: int):
+    # sign_grouping: the signs of all nonzero coefficients of a block are written after the last coefficient
+    # (one run of bypass bins) instead of after each coefficient
+    def __init__(self, bitstream: OBitstream, block_size: int, exact_rate_estimation: bool = True,
+                 sign_grouping: bool = False):
         self.arith_enc = ArithEncoder(bitstream)
         self.cm = ContextModeler(block_size)
+        self.rate_estimator = RateEstimator(self.cm, exact_rate_estimation)
         self.est_bits = 0
         self.block_size = block_size
+        self.sign_grouping = sign_grouping
+
+        # context ids of the sig, gt1 and level prefix bins of each scan position
+        diag_class = np.array(self.cm.diag_class)
+        self.sig_ctx_ids = np.array([model.ctx for model in self.cm.models_sig_flag])[diag_class]
+        self.gt1_ctx_ids = np.array([model.ctx for model in self.cm.models_gt1_flag])[diag_class]
+        self.prefix_ctx_ids = np.array([model.ctx for model in self.cm.models_level_prefix])[diag_class]
+        self.sig_ctx_ids_list = self.sig_ctx_ids.tolist()
+        self.gt1_ctx_ids_list = self.gt1_ctx_ids.tolist()
+        self.prefix_ctx_ids_list = self.prefix_ctx_ids.tolist()
 
     def expGolombProbAdapted(self, value: int, prob, estimation=False):
         assert (value >= 0)
@@ -40,61 +58,73 @@ class EntropyEncoder:
                 self.est_bits += prob.estBits(0)
             self.est_bits += prob.estBits(1)
 
-    def writeQIndex(self, level: int, pos: int, isLast=False):
-        """ Writes a positive or negative value with exp golomb coding and sign bit
+    def binarize_qindexes_list(self, qIdxList, last_scan_index: int):
+        """ Same as binarize_qindexes coefficient by coefficient (faster for few coefficients)
         """
-        self.cm.switchContext(pos)
-
-        if level == 0:
-            if isLast:
-                raise ValueError('Should not occur')
-            self.arith_enc.encodeBin(0, self.cm.prob_sig_flag)
-            return
-        elif abs(level) == 1:
-            if not isLast:
-                self.arith_enc.encodeBin(1, self.cm.prob_sig_flag)
-            self.arith_enc.encodeBin(0, self.cm.prob_gt1_flag)
-            self.arith_enc.encodeBinEP(level > 0)
-            return
-
-        # sig flag: is level unequal to zero?
-        if not isLast:
-            self.arith_enc.encodeBin(1, self.cm.prob_sig_flag)
-
-        # gt1 flag: is absolute value greater than one?
-        self.arith_enc.encodeBin(1, self.cm.prob_gt1_flag)
-
-        # remainder
-        self.expGolombProbAdapted(abs(level) - 2, self.cm.prob_level_prefix)
-
-        self.arith_enc.encodeBinEP(level > 0)
-
-    # similar to writeQindex but estimation only
-    def getEstimateBits(self, level, pos, isLast=False):
-        self.cm.switchContext(pos)
-
-        if level == 0:
-            if isLast:
-                raise ValueError('Should not occur')
-            self.est_bits += self.cm.prob_sig_flag.estBits(0)
-            return
-        elif abs(level) == 1:
-            if not isLast:
-                self.est_bits += self.cm.prob_sig_flag.estBits(1)
-            self.est_bits += self.cm.prob_gt1_flag.estBits(0)
-            self.est_bits += 1
-            return
-            # sig flag: is level unequal to zero?
-        if not isLast:
-            self.est_bits += self.cm.prob_sig_flag.estBits(1)
-
-        # gt1 flag: is absolute value greater than one?
-        self.est_bits += self.cm.prob_gt1_flag.estBits(1)
-
-        # remainder
-        self.expGolombProbAdapted(abs(level) - 2, self.cm.prob_level_prefix, estimation=True)
-
-        self.est_bits += 1
+        bins, ctx_ids, signs = [], [], []
+        sig_ctx_ids, gt1_ctx_ids, prefix_ctx_ids = self.sig_ctx_ids_list, self.gt1_ctx_ids_list, self.prefix_ctx_ids_list
+        for k, level in zip(range(last_scan_index, -1, -1), qIdxList[last_scan_index::-1].tolist()):
+            # sig flag (not coded for the last coefficient)
+            if k != last_scan_index:
+                bins.append(level != 0)
+                ctx_ids.append(sig_ctx_ids[k])
+                if level == 0:
+                    continue
+            # gt1 flag
+            abs_level = abs(level)
+            bins.append(abs_level > 1)
+            ctx_ids.append(gt1_ctx_ids[k])
+            # remainder: n zeros and a one, n bits of abs_level - 1 (without the leading one)
+            if abs_level > 1:
+                n = (abs_level - 1).bit_length() - 1
+                bins += [0] * n + [1]
+                ctx_ids += [prefix_ctx_ids[k]] * (n + 1)
+                bins += [((abs_level - 1) >> i) & 1 for i in range(n - 1, -1, -1)]
+                ctx_ids += [BYPASS] * n
+            # sign
+            if self.sign_grouping:
+                signs.append(level > 0)
+            else:
+                bins.append(level > 0)
+                ctx_ids.append(BYPASS)
+        return bins + signs, ctx_ids + [BYPASS] * len(signs)
+
+    def binarize_qindexes(self, qIdxList, last_scan_index: int):
+        """ Bins and context ids of all quantization indexes from last_scan_index down to 0
+
+        Every coefficient gets a row of bin slots (sig flag, gt1 flag, exp-Golomb prefix and suffix of the
+        remainder, sign), the unused slots are masked out, so the rows read in order give the bin string.
+        With sign grouping the signs of all coefficients follow as one run of bypass bins.
+        """
+        levels = qIdxList[last_scan_index::-1]
+        abs_levels = np.abs(levels)
+        nonzero = abs_levels != 0
+        greater1 = (abs_levels > 1)[:, None]
+        # exp-Golomb class of the remainder abs_level - 2 (0 for abs_level < 3)
+        n = np.frexp(np.maximum(abs_levels - 1, 1))[1][:, None] - 1
+        max_n = int(n.max())
+        prefix_slots = np.arange(max_n + 1)
+
+        # sig flag (not coded for the last coefficient), gt1 flag
+        flags_valid = np.ones((levels.size, 2), dtype=bool)
+        flags_valid[0, 0] = False
+        flags_valid[:, 1] = nonzero
+        # n zeros and a one, n bits of abs_level - 1 (without the leading one), sign
+        prefix_valid = greater1 & (prefix_slots <= n)
+        suffix_valid = greater1 & (prefix_slots < n)
+        suffix_valid[:, -1] = nonzero & (not self.sign_grouping)
+        valid = np.hstack([flags_valid, prefix_valid, suffix_valid])
+
+        suffix_bins = ((abs_levels[:, None] - 1) >> np.maximum(n - 1 - prefix_slots, 0)) & 1
+        suffix_bins[:, -1] = levels > 0
+        bins = np.hstack([nonzero[:, None], greater1, prefix_slots == n, suffix_bins])
+        ctx_ids = np.hstack([self.sig_ctx_ids[last_scan_index::-1, None], self.gt1_ctx_ids[last_scan_index::-1, None],
+                             np.repeat(self.prefix_ctx_ids[last_scan_index::-1, None], max_n + 1, axis=1),
+                             np.full((levels.size, max_n + 1), BYPASS)])
+        if self.sign_grouping:
+            signs = (levels[nonzero] > 0).tolist()
+            return bins[valid].tolist() + signs, ctx_ids[valid].tolist() + [BYPASS] * len(signs)
+        return bins[valid].tolist(), ctx_ids[valid].tolist()
 
     def write_qindexes_block(self, qIdxBlock):
         """ Writes all quantization indexes
@@ -109,9 +139,12 @@ class EntropyEncoder:
         last_scan_index = np.max(np.nonzero(qIdxList))
         self.expGolombProbAdapted(last_scan_index, self.cm.prob_last_prefix)
 
-        self.writeQIndex(qIdxList[last_scan_index], last_scan_index, isLast=True)
-        for k in range(last_scan_index - 1, -1, -1):
-            self.writeQIndex(qIdxList[k], k)
+        # coefficients from the last one down to 0, coded in one call
+        if last_scan_index + 1 >= VECTORIZED_BINARIZATION_MIN:
+            bins, ctx_ids = self.binarize_qindexes(qIdxList, last_scan_index)
+        else:
+            bins, ctx_ids = self.binarize_qindexes_list(qIdxList, last_scan_index)
+        self.arith_enc.encodeBinString(bins, ctx_ids, self.cm.states)
 
     def write_block_intra_pic(self, qIdxBlock, prediction_mode):
         """ Writes all values sequential to the bitstream
@@ -168,23 +201,12 @@ class EntropyEncoder:
 
     # add bits for quantization indexes (both intra and inter pictures)
     def add_bits_qindex_block(self, qIdxBlock):
-        qIdxList = qIdxBlock.ravel()
-        coded_block_flag = np.any(qIdxList != 0)
-        self.est_bits += self.cm.prob_cbf.estBits(coded_block_flag)
-        if not coded_block_flag:
-            return
-
-        last_scan_index = np.max(np.nonzero(qIdxList))
-        self.expGolombProbAdapted(last_scan_index, self.cm.prob_last_prefix, estimation=True)
-
-        self.getEstimateBits(qIdxList[last_scan_index], last_scan_index, isLast=True)
-        for k in range(last_scan_index - 1, -1, -1):
-            self.getEstimateBits(qIdxList[k], k)
+        self.est_bits += BIT_SCALE * self.rate_estimator.qindex_block_bits(qIdxBlock)
 
     # similar to write_block_intra_pic but estimation only
     def est_block_bits_intra_pic(self, predMode, qIdxBlock):
         self.est_bits = 0
-        org_probs = copy.deepcopy(self.cm)
+        org_states = self.cm.saveStates()
 
         if predMode == PredictionMode.PLANAR_PREDICTION:
             self.est_bits += self.cm.prediction_mode_bin1.estBits(0)
@@ -203,13 +225,13 @@ class EntropyEncoder:
         # quant indexes
         self.add_bits_qindex_block(qIdxBlock)
 
-        self.cm = org_probs
+        self.cm.restoreStates(org_states)
         return self.est_bits
 
     # similar to write_block_inter_pic but estimation only
     def est_block_bits_inter_pic(self, qIdxBlock, inter_flag: int, mx: int, my: int):
         self.est_bits = 0
-        org_probs = copy.deepcopy(self.cm)
+        org_states = self.cm.saveStates()
 
         # side info
         self.est_bits += self.cm.prediction_inter_flag.estBits(inter_flag)
@@ -231,5 +253,5 @@ class EntropyEncoder:
         # quant indexes
         self.add_bits_qindex_block(qIdxBlock)
 
-        self.cm = org_probs
+        self.cm.restoreStates(org_states)
         return self.est_bits
@@ -1,32 +1,68 @@
+import mmap
+
+
 class IBitstream:
-    # constructor: open specified input file
-    def __init__(self, filename):
-        self.file = open(filename, 'rb')
-        if not self.file:
-            raise Exception('IBitstream: Could not open file')
+    # constructor: map specified input file or use the given bytes-like object
+    #    - the bitstream is read through a byte cursor into a bit reservoir of up to 64 bits
+    def __init__(self, source):
+        self.mmap = None
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self.data = memoryview(source)
+        else:
+            with open(source, 'rb') as file:
+                try:
+                    self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                    self.data = memoryview(self.mmap)
+                except ValueError:  # empty file cannot be mapped
+                    self.data = memoryview(b'')
+        self.size = len(self.data)
+        self.pos = 0  # next byte that is not in the reservoir
         self.availBits = 0
-        self.buffer = 0
+        self.buffer = 0  # bit reservoir, holds availBits bits
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self.data.release()
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
 
     def is_EOF(self) -> bool:
-        byte_s = self.file.read(1)
-        if not byte_s:
-            return True
-        self.file.seek(-1, 1)
-        return False
+        return self.pos >= self.size and self.availBits < 8
+
+    # byte position of the next bit (rounded down if not byte aligned)
+    def tell(self) -> int:
+        return self.pos - (self.availBits + 7) // 8
+
+    # continue reading at the given byte position
+    def seek(self, byte_pos: int):
+        if not 0 <= byte_pos <= self.size:
+            raise Exception('IBitstream: Seek position outside of bitstream')
+        self.pos = byte_pos
+        self.availBits = 0
+        self.buffer = 0
+
+    # read whole bytes (bitstream has to be byte aligned)
+    def get_bytes(self, num_bytes: int) -> memoryview:
+        if self.availBits % 8 != 0:
+            raise Exception('IBitstream: Bitstream is not byte aligned')
+        start = self.tell()
+        if start + num_bytes > self.size:
+            raise Exception('IBitstream: Tried to read byte after eof')
+        self.seek(start + num_bytes)
+        return self.data[start:start + num_bytes]
 
     def get_bit(self) -> int:
         """Reads a single bit from the bitstream
 
             :return next bit value 0 or 1
         """
-        if self.availBits == 0:
-            byte_s = self.file.read(1)
-            if not byte_s:
-                raise Exception('IBitstream: Tried to read byte after eof')
-            self.buffer = byte_s[0]
-            self.availBits = 8
-        self.availBits -= 1
-        return (self.buffer >> self.availBits) & 1
+        return self.get_bits(1)
 
     def get_bits(self, num_bits: int) -> int:
         """Read multiple bits from the bitstream, most significant bit first
@@ -34,28 +70,24 @@ class IBitstream:
             :param      num_bits: Specifies the numbers of bits to read
             :return:    integer representation of bits read
         """
-        if num_bits <= self.availBits:
-            self.availBits -= num_bits
-            return (self.buffer >> self.availBits) & ((1 << num_bits) - 1)
-        value = 0
-        if self.availBits:
-            value = self.buffer & ((1 << self.availBits) - 1)
-            num_bits -= self.availBits
-            self.availBits = 0
-        while num_bits >= 8:
-            byte_s = self.file.read(1)
-            if not byte_s:
-                raise Exception('IBitstream: Tried to read byte after eof')
-            value = (value << 8) | int(byte_s[0])
-            num_bits -= 8
-        if num_bits > 0:
-            byte_s = self.file.read(1)
-            if not byte_s:
-                raise Exception('IBitstream: Tried to read byte after eof')
-            self.buffer = byte_s[0]
-            self.availBits = 8 - num_bits
-            value = (value << num_bits) | (self.buffer >> self.availBits)
+        if num_bits > self.availBits:
+            self.__refill(num_bits)
+        self.availBits -= num_bits
+        value = self.buffer >> self.availBits
+        self.buffer &= (1 << self.availBits) - 1
         return value
 
     def byteAlign(self):
-        self.availBits = 0
+        # drop the remaining bits of the current byte
+        self.availBits -= self.availBits % 8
+        self.buffer &= (1 << self.availBits) - 1
+
+    # private method: load whole bytes so that at least num_bits bits are available
+    def __refill(self, num_bits: int):
+        num_bytes = max((64 - self.availBits) // 8, (num_bits - self.availBits + 7) // 8)
+        if self.pos + (num_bits - self.availBits + 7) // 8 > self.size:
+            raise Exception('IBitstream: Tried to read byte after eof')
+        chunk = self.data[self.pos:self.pos + num_bytes]
+        self.buffer = (self.buffer << (8 * len(chunk))) | int.from_bytes(chunk, 'big')
+        self.availBits += 8 * len(chunk)
+        self.pos += len(chunk)
@@ -0,0 +1,81 @@
+# ===== patterns for the fast integer motion vector search =====
+# offsets are given as (mx, my) in integer samples
+SMALL_DIAMOND = ((-1, 0), (1, 0), (0, 1), (0, -1))
+LARGE_DIAMOND = ((-2, 0), (2, 0), (0, 2), (0, -2), (-1, -1), (1, -1), (-1, 1), (1, 1))
+HEXAGON = ((-2, 0), (2, 0), (-1, -2), (1, -2), (-1, 2), (1, 2))
+SIXTEEN_POINT_HEXAGON = ((0, -4), (0, 4), (-4, 0), (4, 0), (-4, -1), (4, -1), (-4, 1), (4, 1),
+                         (-4, -2), (4, -2), (-4, 2), (4, 2), (-2, -3), (2, -3), (-2, 3), (2, 3))
+
+SEARCH_PATTERN_NAMES = ('log', 'small-diamond', 'large-diamond', 'hexagon', 'umhexagon')
+
+
+def scale_offsets(offsets, factor: int):
+    return tuple((factor * dx, factor * dy) for dx, dy in offsets)
+
+
+# A search pattern is a sequence of stages (offsets, repeat). Each stage evaluates the offsets around the
+# current center and moves to the best point. A repeated stage continues until the center itself is best,
+# a single stage moves once and hands over to the next stage.
+def get_search_pattern(name: str, search_range: int):
+    if name == 'log':
+        # logarithmic search: diamond of size 2, then of size 1
+        return ((scale_offsets(SMALL_DIAMOND, 2), True), (SMALL_DIAMOND, True))
+    elif name == 'small-diamond':
+        return ((SMALL_DIAMOND, True),)
+    elif name == 'large-diamond':
+        return ((LARGE_DIAMOND, True), (SMALL_DIAMOND, True))
+    elif name == 'hexagon':
+        return ((HEXAGON, True), (SMALL_DIAMOND, True))
+    elif name == 'umhexagon':
+        # unsymmetrical cross, 5x5 square and multi-hexagon grid, then hexagon and diamond refinement
+        cross = tuple((dx, 0) for k in range(1, search_range // 2 + 1) for dx in (-2 * k, 2 * k)) + \
+            tuple((0, dy) for k in range(1, search_range // 4 + 1) for dy in (-2 * k, 2 * k))
+        square = tuple((dx, dy) for dy in range(-2, 3) for dx in range(-2, 3) if dx != 0 or dy != 0)
+        grid = tuple(offset for k in range(1, max(1, search_range // 4) + 1)
+                     for offset in scale_offsets(SIXTEEN_POINT_HEXAGON, k))
+        return ((cross, False), (square, False), (grid, False), (HEXAGON, True), (SMALL_DIAMOND, True))
+    else:
+        raise Exception('Unsupported search pattern')
+
+
+# lagrangian costs of the motion vector candidates of one block, each candidate is evaluated only once
+class CostCache:
+    def __init__(self, cost_function):
+        self.cost_function = cost_function
+        self.costs = {}
+        self.lookups = 0
+
+    def __call__(self, mx: int, my: int) -> float:
+        self.lookups += 1
+        cost = self.costs.get((mx, my))
+        if cost is None:
+            cost = self.cost_function(mx, my)
+            self.costs[(mx, my)] = cost
+        return cost
+
+    def num_evaluated(self) -> int:
+        return len(self.costs)
+
+
+def pattern_search(cost: CostCache, start_mx: int, start_my: int, stages, bounds):
+    mx_min, my_min, mx_max, my_max = bounds
+    center_x, center_y = start_mx, start_my
+    for offsets, repeat in stages:
+        while True:
+            # the center wins ties, otherwise the first candidate with minimum cost
+            best_x, best_y = center_x, center_y
+            min_cost = cost(center_x, center_y)
+            for dx, dy in offsets:
+                mx = center_x + dx
+                my = center_y + dy
+                if mx_min <= mx <= mx_max and my_min <= my <= my_max:
+                    cand_cost = cost(mx, my)
+                    if cand_cost < min_cost:
+                        min_cost = cand_cost
+                        best_x, best_y = mx, my
+            if best_x == center_x and best_y == center_y:
+                break
+            center_x, center_y = best_x, best_y
+            if not repeat:
+                break
+    return center_x, center_y
@@ -2,19 +2,38 @@
 
 class OBitstream:
     # constructor: open specified output file and initialize members
-    def __init__(self, filename):
-        self.file = open(filename, 'wb')
+    #    - target = file name, writable binary file object or None (bitstream is kept in memory, see getvalue())
+    #    - complete bytes are collected in a buffer and written to the target in chunks of flush_size bytes
+    def __init__(self, target=None, flush_size: int = 1 << 16):
+        if target is None:
+            self.file = None
+            self.owns_file = False
+        elif hasattr(target, 'write'):
+            self.file = target
+            self.owns_file = False
+        else:
+            self.file = open(target, 'wb')
+            self.owns_file = True
+        self.flush_size = flush_size
+        self.data = bytearray()
+        self.num_flushed = 0  # bytes already written to the target
+        self.is_open = True
         self.buffer = 0
         self.bit_counter = 0
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.is_open:
+            self.terminate()
+
     # add bit to bitstream
     def addBit(self, bit: int):  # only 0 or 1
         self.buffer = (self.buffer << 1) | int(bool(bit))
         self.bit_counter += 1
         if self.bit_counter == 8:
-            if not self.file:
-                raise Exception('OBitstream: File not open')
-            self.file.write(self.buffer.to_bytes(1, byteorder='big'))
+            self.__add_byte(self.buffer)
             self.buffer = 0
             self.bit_counter = 0
 
@@ -24,27 +43,61 @@ class OBitstream:
             self.buffer = (self.buffer << numBits) | int(bitPattern & ((1 << numBits) - 1))
             self.bit_counter += numBits
             return
-        if not self.file:
-            raise Exception('OBitstream: File not open')
         if self.bit_counter:
             freeBits = 8 - self.bit_counter
             self.buffer = (self.buffer << freeBits) | int((bitPattern >> (numBits - freeBits)) & ((1 << freeBits) - 1))
             numBits -= freeBits
-            self.file.write(self.buffer.to_bytes(1, byteorder='big'))
+            self.__add_byte(self.buffer)
         while numBits >= 8:
             numBits -= 8
-            self.buffer = int(bitPattern >> numBits) & 255
-            self.file.write(self.buffer.to_bytes(1, byteorder='big'))
+            self.__add_byte(int(bitPattern >> numBits) & 255)
         self.buffer = int(bitPattern & ((1 << numBits) - 1))
         self.bit_counter = numBits
 
+    # append complete bytes (bitstream has to be byte aligned)
+    def addBytes(self, data):
+        if not self.is_open:
+            raise Exception('OBitstream: File not open')
+        if self.bit_counter != 0:
+            raise Exception('OBitstream: Bitstream is not byte aligned')
+        self.data += data
+        if self.file is not None and len(self.data) >= self.flush_size:
+            self.flush()
+
     # write zeros to fill last byte
     def byteAlign(self):
         if self.bit_counter != 0:
             self.addBits(0, 8 - self.bit_counter)
 
+    # write all complete bytes to the target file
+    def flush(self):
+        if self.file is not None and self.data:
+            self.file.write(self.data)
+            self.num_flushed += len(self.data)
+            self.data = bytearray()
+
+    # number of complete bytes written so far (byte position of the next byte after byteAlign())
+    def tell(self) -> int:
+        return self.num_flushed + len(self.data)
+
+    # bytes of an in-memory bitstream (complete bytes only, call terminate() first)
+    def getvalue(self) -> bytes:
+        if self.file is not None:
+            raise Exception('OBitstream: Bitstream is written to a file')
+        return bytes(self.data)
+
     # terminate bitstream (and close file)
     def terminate(self):
         self.byteAlign()
-        self.file.close()
-        self.file = None
+        self.flush()
+        if self.owns_file:
+            self.file.close()
+        self.is_open = False
+
+    # private method for output of a complete byte
+    def __add_byte(self, byte: int):
+        if not self.is_open:
+            raise Exception('OBitstream: File not open')
+        self.data.append(byte)
+        if self.file is not None and len(self.data) >= self.flush_size:
+            self.flush()
@@ -1,7 +1,21 @@
 from enum import IntEnum
 
 import numpy as np
-from scipy import signal
+
+# taps for the samples left and right of a half-sample position (scaled by 64)
+HALF_SAMPLE_FILTERS = {
+    'bilinear': (32,),  # [32, 64, 32] / 64
+    '8-tap': (40, -11, 4, -1),  # [-1, 0, 4, 0, -11, 0, 40, 64, 40, 0, -11, 0, 4, 0, -1] / 64
+}
+INTERPOLATION_FILTERS = tuple(HALF_SAMPLE_FILTERS)
+
+
+# value / 2**shift rounded to the nearest integer, ties to even (same as np.rint)
+def rint_shift(value: np.ndarray, shift: int) -> np.ndarray:
+    quotient = value >> shift
+    remainder = value & ((1 << shift) - 1)
+    return quotient + ((2 * remainder + (quotient & 1)) > (1 << shift))
+
 
 class PredictionMode(IntEnum):
     DC_PREDICTION = 0
@@ -11,33 +25,84 @@ class PredictionMode(IntEnum):
 
 
 class PredictionCalculator:
-    def __init__(self, image: np.ndarray, blocksize: int, ref_image: np.array = None):
+    # motion vectors are given in units of 1/mv_precision samples (2: half-sample, 4: quarter-sample)
+    def __init__(self, image: np.ndarray, blocksize: int, ref_image: np.array = None, mv_precision: int = 2,
+                 interpolation_filter: str = 'bilinear'):
         self.image = image
         self.ref_image = ref_image
-        self.interpolated_ref_image = self.half_sample_interpolation(ref_image) if ref_image is not None else None
+        self.mv_precision = mv_precision
+        self.interpolation_filter = interpolation_filter
+        self.interpolated_ref_image = None
+        if ref_image is not None:
+            self.interpolated_ref_image = self.half_sample_interpolation(ref_image)
+            if mv_precision == 4:
+                self.interpolated_ref_image = self.quarter_sample_interpolation(self.interpolated_ref_image)
         self.coded_width = self.image.shape[1]
         self.coded_height = self.image.shape[0]
         self.blocksize = blocksize
         self.mv = np.zeros([self.coded_height // self.blocksize + 1,
                             self.coded_width // self.blocksize + 2, 2], dtype=np.int)
         if self.interpolated_ref_image is not None:
-            self.max_xh = self.interpolated_ref_image.shape[1] - (2 * self.blocksize - 1)
-            self.max_yh = self.interpolated_ref_image.shape[0] - (2 * self.blocksize - 1)
+            self.max_xh = self.interpolated_ref_image.shape[1] - (mv_precision * (self.blocksize - 1) + 1)
+            self.max_yh = self.interpolated_ref_image.shape[0] - (mv_precision * (self.blocksize - 1) + 1)
 
     def half_sample_interpolation(self, image: np.ndarray) -> np.ndarray:
-        # 1. Pad the (already padded) image with another 4 samples at each side (using sample repetition)
-        image = np.pad(image, ((4, 4), (4, 4)), "edge")
-        # 2. Create new image of size(2W+4B+8)×(2H+4B+8)that is filled with zeros andcopy the samples at integer positions from padded image (use NumPy slicing)
-        spreaded_image = np.zeros([2*a for a in image.shape])
-        spreaded_image[::2,::2] = image
-        # 3 - 4 Vertical and Horizontal interpolation
-        #kernel = np.array([[-1, 0, 4, 0, -11, 0, 40, 64, 40, 0, -11, 0, 4, 0, -1]]) / 64
-        kernel = np.array([[32, 64, 32]]) / 64
-        spreaded_image = signal.convolve2d(spreaded_image, kernel.T, mode="same")
-        spreaded_image = signal.convolve2d(spreaded_image, kernel, mode="same")
-        # 5 Round the result to integers
-        spreaded_image = np.clip(np.rint(spreaded_image), 0, 255).astype(int)
-        return spreaded_image[8:-8,8:-8]
+        # the three half-sample phases are computed directly and interleaved with the integer samples:
+        # [2y, 2x] integer, [2y, 2x + 1] horizontal, [2y + 1, 2x] vertical, [2y + 1, 2x + 1] diagonal half-sample
+        height, width = image.shape
+        interpolated_image = np.empty([2 * height, 2 * width], dtype=np.uint8)
+        interpolated_image[::2, ::2] = image
+        if self.interpolation_filter == 'bilinear':
+            horizontal, vertical, diagonal = self.bilinear_half_sample_phases(image)
+        else:
+            horizontal, vertical, diagonal = self.half_sample_phases(image, HALF_SAMPLE_FILTERS[self.interpolation_filter])
+        interpolated_image[::2, 1::2] = horizontal
+        interpolated_image[1::2, ::2] = vertical
+        interpolated_image[1::2, 1::2] = diagonal
+        return interpolated_image
+
+    # kernel [32, 64, 32] / 64: averages of two (four) neighbouring samples
+    def bilinear_half_sample_phases(self, image: np.ndarray):
+        # repeat the last row and column (sample repetition at the bottom and right border)
+        image = np.pad(image, ((0, 1), (0, 1)), "edge").astype(np.int16)
+        horizontal = image[:-1, :-1] + image[:-1, 1:]
+        vertical = image[:-1, :-1] + image[1:, :-1]
+        diagonal = horizontal + image[1:, :-1] + image[1:, 1:]
+        return rint_shift(horizontal, 1), rint_shift(vertical, 1), rint_shift(diagonal, 2)
+
+    # separable filter with the given taps (multiplied by 64) for the samples left and right of the half-sample
+    # position, e.g. taps [40, -11, 4, -1] for kernel [-1, 0, 4, 0, -11, 0, 40, 64, 40, 0, -11, 0, 4, 0, -1] / 64
+    def half_sample_phases(self, image: np.ndarray, taps):
+        # pad the (already padded) image with another 4 samples at each side (using sample repetition)
+        image = np.pad(image, ((4, 4), (4, 4)), "edge").astype(np.int32)
+
+        def filter_half(samples, axis):
+            length = samples.shape[axis] - 8
+            result = 0
+            for k, tap in enumerate(taps):
+                result = result + tap * (np.take(samples, range(4 - k, 4 - k + length), axis=axis) +
+                                         np.take(samples, range(5 + k, 5 + k + length), axis=axis))
+            return result
+
+        # vertical filtering (integer rows are scaled by the center tap 64 to keep a common scale)
+        vertical = filter_half(image, 0)
+        integer_rows = 64 * image[4:-4, :]
+        # horizontal filtering, all phases are scaled by 64 * 64
+        horizontal = filter_half(integer_rows, 1)
+        diagonal = filter_half(vertical, 1)
+        vertical = 64 * vertical[:, 4:-4]
+        return tuple(np.clip(rint_shift(phase, 12), 0, 255) for phase in (horizontal, vertical, diagonal))
+
+    def quarter_sample_interpolation(self, half_sample_image: np.ndarray) -> np.ndarray:
+        # quarter-sample positions are the rounded average of the neighbouring half-sample positions
+        image = np.pad(half_sample_image, ((0, 1), (0, 1)), "edge").astype(np.int16)
+        height, width = half_sample_image.shape
+        quarter_image = np.empty([2 * height, 2 * width], dtype=half_sample_image.dtype)
+        quarter_image[::2, ::2] = half_sample_image
+        quarter_image[::2, 1::2] = (image[:-1, :-1] + image[:-1, 1:] + 1) >> 1
+        quarter_image[1::2, ::2] = (image[:-1, :-1] + image[1:, :-1] + 1) >> 1
+        quarter_image[1::2, 1::2] = (image[:-1, :-1] + image[:-1, 1:] + image[1:, :-1] + image[1:, 1:] + 2) >> 2
+        return quarter_image
 
     def store_mv(self, x: int, y: int, mx: int, my: int):
         yb = y // self.blocksize + 1
@@ -82,6 +147,22 @@ class PredictionCalculator:
         else:
             raise Exception('Unsupported prediction mode')
 
+    # predictions of all intra modes, indexed by PredictionMode
+    def get_all_predictions(self, x: int, y: int) -> np.ndarray:
+        top_samples = self.top_border(x, y).astype('int32')
+        left_samples = self.left_border(x, y).astype('int32')
+        pred_blocks = np.empty([len(PredictionMode), self.blocksize, self.blocksize], dtype='int32')
+        pred_blocks[PredictionMode.DC_PREDICTION] = self.get_dc_prediction(x, y)
+        pred_blocks[PredictionMode.VERTICAL_PREDICTION] = top_samples[np.newaxis, :]
+        pred_blocks[PredictionMode.HORIZONTAL_PREDICTION] = left_samples[:, np.newaxis]
+
+        # planar: same integer arithmetic as get_planar_prediction, as outer products
+        weights = np.arange(self.blocksize)
+        horizontal = np.outer(left_samples, self.blocksize - 1 - weights) + np.outer(np.full(self.blocksize, top_samples[-1]), 1 + weights)
+        vertical = np.outer(self.blocksize - 1 - weights, top_samples) + np.outer(1 + weights, np.full(self.blocksize, left_samples[-1]))
+        pred_blocks[PredictionMode.PLANAR_PREDICTION] = (horizontal + vertical + self.blocksize) // (2 * self.blocksize)
+        return pred_blocks
+
     def get_dc_prediction(self, x: int, y: int) -> np.ndarray:
         dc = 128
         if x > 0 and y > 0:
@@ -123,6 +204,17 @@ class PredictionCalculator:
         return pred_block
 
     def get_inter_prediction(self, x: int, y: int, mx: int, my: int):
-        xh = max(0, min(2 * (x + self.blocksize) + mx, self.max_xh))  # clip to image area
-        yh = max(0, min(2 * (y + self.blocksize) + my, self.max_yh))  # clip to image area
-        return self.interpolated_ref_image[yh:yh + 2*self.blocksize:2, xh:xh + 2*self.blocksize:2]
+        p = self.mv_precision
+        xh = max(0, min(p * (x + self.blocksize) + mx, self.max_xh))  # clip to image area
+        yh = max(0, min(p * (y + self.blocksize) + my, self.max_yh))  # clip to image area
+        return self.interpolated_ref_image[yh:yh + p*self.blocksize:p, xh:xh + p*self.blocksize:p]
+
+    # predictions for all combinations of the sub-sample vectors mxs and mys, indexed [my, mx, y, x]
+    def get_inter_predictions(self, x: int, y: int, mxs: np.ndarray, mys: np.ndarray) -> np.ndarray:
+        p = self.mv_precision
+        offsets = p * np.arange(self.blocksize)
+        xh = np.clip(p * (x + self.blocksize) + mxs, 0, self.max_xh)  # clip to image area
+        yh = np.clip(p * (y + self.blocksize) + mys, 0, self.max_yh)  # clip to image area
+        rows = (yh[:, np.newaxis] + offsets)[:, np.newaxis, :, np.newaxis]
+        cols = (xh[:, np.newaxis] + offsets)[np.newaxis, :, np.newaxis, :]
+        return self.interpolated_ref_image[rows, cols]
@@ -0,0 +1,127 @@
+import numpy as np
+
+from arithBase import EntropyBits, NextStateMPS, NextStateLPS
+from ContextModeler import ContextModeler
+
+# ===== tables for table-driven bit estimation =====
+# All costs are integers in units of 2**-15 bits (the unit of EntropyBits). Sums of these integers are exact,
+# so the estimate is identical to accumulating ProbModel.estBits() in floating point.
+BIT_SCALE = 0.000030517578125
+ONE_BIT = 1 << 15  # bypass coded bin
+
+# cost and next state of a bin, indexed by 2 * pstate + bin
+BIN_BITS = [EntropyBits[pstate ^ bin] for pstate in range(128) for bin in (0, 1)]
+NEXT_STATE = [NextStateMPS[pstate] if bin == (pstate & 1) else NextStateLPS[pstate]
+              for pstate in range(128) for bin in (0, 1)]
+
+# cost and next state of the exp-Golomb class prefix (n zeros followed by a one), indexed by [pstate][n]
+MAX_PREFIX_LENGTH = 64
+
+
+def gen_prefix_tables():
+    prefix_bits = []
+    prefix_state = []
+    for pstate in range(128):
+        bits_row, state_row = [], []
+        bits, state = 0, pstate
+        for n in range(MAX_PREFIX_LENGTH):
+            bits_row.append(bits + BIN_BITS[2 * state + 1])
+            state_row.append(NEXT_STATE[2 * state + 1])
+            bits += BIN_BITS[2 * state]
+            state = NEXT_STATE[2 * state]
+        prefix_bits.append(bits_row)
+        prefix_state.append(state_row)
+    return prefix_bits, prefix_state
+
+
+PREFIX_BITS, PREFIX_STATE = gen_prefix_tables()
+BIN_BITS_ARRAY = np.array(BIN_BITS, dtype=np.int64)
+
+
+def exp_golomb_class(value: int) -> int:
+    return (value + 1).bit_length() - 1
+
+
+# Estimates the bits of the quantization indexes of a scanned block from the context states of a ContextModeler.
+# exact: tracks the state evolution bin by bin (same result as coding with estBits),
+# otherwise: all coefficient contexts are frozen at their state at the start of the block (vectorized).
+# The states of the ContextModeler are not modified.
+class RateEstimator:
+    def __init__(self, cm: ContextModeler, exact: bool = True):
+        self.cm = cm
+        self.exact = exact
+        self.diag_class = cm.diag_class
+        self.diag_class_array = np.array(cm.diag_class)
+
+    # bits in units of 2**-15 bits
+    def qindex_block_bits(self, qIdxBlock) -> int:
+        qIdxList = qIdxBlock.ravel()
+        nonzero = np.flatnonzero(qIdxList)
+        cbf_state = self.cm.prob_cbf.pstate
+        if nonzero.size == 0:
+            return BIN_BITS[2 * cbf_state]
+        last_scan_index = int(nonzero[-1])
+
+        # coded block flag and position of the last coefficient
+        bits = BIN_BITS[2 * cbf_state + 1]
+        bits += self.exp_golomb_bits(last_scan_index, self.cm.prob_last_prefix.pstate)[0]
+
+        if self.exact:
+            return bits + self.coefficient_bits_exact(qIdxList[:last_scan_index + 1].tolist(), last_scan_index)
+        return bits + self.coefficient_bits_frozen(qIdxList[:last_scan_index + 1], last_scan_index)
+
+    def exp_golomb_bits(self, value: int, pstate: int):
+        n = exp_golomb_class(value)
+        if n < MAX_PREFIX_LENGTH:
+            return PREFIX_BITS[pstate][n] + n * ONE_BIT, PREFIX_STATE[pstate][n]
+        bits = n * ONE_BIT
+        for _ in range(n):
+            bits += BIN_BITS[2 * pstate]
+            pstate = NEXT_STATE[2 * pstate]
+        return bits + BIN_BITS[2 * pstate + 1], NEXT_STATE[2 * pstate + 1]
+
+    def coefficient_bits_exact(self, levels, last_scan_index: int) -> int:
+        sig = [model.pstate for model in self.cm.models_sig_flag]
+        gt1 = [model.pstate for model in self.cm.models_gt1_flag]
+        prefix = [model.pstate for model in self.cm.models_level_prefix]
+        diag_class = self.diag_class
+
+        bits = 0
+        for k in range(last_scan_index, -1, -1):
+            level = levels[k]
+            cl = diag_class[k]
+            # sig flag (not coded for the last coefficient)
+            if k != last_scan_index:
+                index = 2 * sig[cl] + (level != 0)
+                bits += BIN_BITS[index]
+                sig[cl] = NEXT_STATE[index]
+                if level == 0:
+                    continue
+            # gt1 flag and sign
+            abs_level = abs(level)
+            index = 2 * gt1[cl] + (abs_level > 1)
+            bits += BIN_BITS[index] + ONE_BIT
+            gt1[cl] = NEXT_STATE[index]
+            # remainder
+            if abs_level > 1:
+                remainder_bits, prefix[cl] = self.exp_golomb_bits(abs_level - 2, prefix[cl])
+                bits += remainder_bits
+        return bits
+
+    def coefficient_bits_frozen(self, levels: np.ndarray, last_scan_index: int) -> int:
+        abs_levels = np.abs(levels)
+        classes = self.diag_class_array[:last_scan_index + 1]
+        sig = np.array([model.pstate for model in self.cm.models_sig_flag])[classes]
+        gt1 = np.array([model.pstate for model in self.cm.models_gt1_flag])[classes]
+        prefix = np.array([model.pstate for model in self.cm.models_level_prefix])[classes]
+
+        # sig flags (not coded for the last coefficient)
+        bits = BIN_BITS_ARRAY[2 * sig[:-1] + (abs_levels[:-1] != 0)].sum()
+        # gt1 flags and signs
+        nonzero = abs_levels != 0
+        bits += BIN_BITS_ARRAY[2 * gt1[nonzero] + (abs_levels[nonzero] > 1)].sum() + ONE_BIT * np.count_nonzero(nonzero)
+        # remainders: n zeros and a one with frozen state plus n bypass bins
+        greater1 = abs_levels > 1
+        n = np.frexp(abs_levels[greater1] - 1)[1] - 1  # exp-Golomb class of abs_level - 2
+        bits += (n * (BIN_BITS_ARRAY[2 * prefix[greater1]] + ONE_BIT) + BIN_BITS_ARRAY[2 * prefix[greater1] + 1]).sum()
+        return int(bits)
@@ -0,0 +1,55 @@
+from functools import lru_cache
+
+import numpy as np
+
+from PredictionCalculator import PredictionMode
+
+
+# Scan orders of a block as permutations of the raster (row-major) sample indexes:
+#   scanned = block.ravel()[scan]    and    block = scanned[inverse].reshape(block_size, block_size)
+class ScanTables:
+    def __init__(self, block_size: int):
+        self.block_size = block_size
+        raster = np.arange(block_size * block_size).reshape(block_size, block_size)
+
+        self.diagonal = self.gen_diagonal_scan(block_size)
+        self.horizontal = raster.ravel()
+        self.vertical = raster.T.ravel()
+
+        # scan used for each prediction mode (indexed by PredictionMode)
+        self.mode_scans = np.empty([len(PredictionMode), block_size * block_size], dtype=np.intp)
+        self.mode_scans[PredictionMode.DC_PREDICTION] = self.diagonal
+        self.mode_scans[PredictionMode.PLANAR_PREDICTION] = self.diagonal
+        self.mode_scans[PredictionMode.HORIZONTAL_PREDICTION] = self.vertical
+        self.mode_scans[PredictionMode.VERTICAL_PREDICTION] = self.horizontal
+        self.mode_inverse_scans = np.argsort(self.mode_scans, axis=1)
+        self.diagonal_inverse = np.argsort(self.diagonal)
+
+        # diagonal (row + column) of each position in diagonal scan order and its context class
+        self.diag_map = self.diagonal // block_size + self.diagonal % block_size
+        self.diag_class = np.where(self.diag_map < 4, 0, np.where(self.diag_map < 7, 1, 2))
+
+    # anti-diagonals from the top left, each one from bottom left to top right
+    def gen_diagonal_scan(self, block_size):
+        scan = []
+        (rows, columns) = (block_size, block_size)
+        for line in range(1, (rows + columns)):
+
+            start_col = max(0, line - rows)
+            count = min(line, (columns - start_col), rows)
+
+            for j in range(0, count):
+                scan.append((min(rows, line) - j - 1) * columns + start_col + j)
+
+        return np.array(scan, dtype=np.intp)
+
+    def scan(self, block: np.ndarray, prediction_mode: PredictionMode) -> np.ndarray:
+        return block.take(self.mode_scans[prediction_mode])
+
+    def inverse_scan(self, scanned: np.ndarray, prediction_mode: PredictionMode) -> np.ndarray:
+        return scanned.take(self.mode_inverse_scans[prediction_mode]).reshape(self.block_size, self.block_size)
+
+
+@lru_cache(maxsize=None)
+def get_scan_tables(block_size: int) -> ScanTables:
+    return ScanTables(block_size)
@@ -61,11 +61,32 @@ EntropyBits = [
 ]
 
 
+# fused coding table: (LPS range, renormalization bits after LPS, next state after MPS, next state after LPS),
+# indexed by (pstate << 2) | range quadrant (bits 6 and 7 of the range)
+CodingTable = [(LPSTable[pstate >> 1][quadrant], RenormTable[LPSTable[pstate >> 1][quadrant] >> 3],
+                NextStateMPS[pstate], NextStateLPS[pstate]) for pstate in range(128) for quadrant in range(4)]
+
+# context id of bypass coded bins in bin strings (see ArithEncoder.encodeBinString)
+BYPASS = -1
+
+
 # ----- probability model -----
 class ProbModel:
-    # constructor (set p0=p1=0.5)
-    def __init__(self):
-        self.pstate: int = 0
+    # constructor (set p0=p1=0.5):
+    #    - states = bytearray with the states of all contexts, ctx = index of this context
+    #    - without states the model uses a bytearray of its own
+    def __init__(self, states=None, ctx: int = 0):
+        self.states = bytearray(1) if states is None else states
+        self.ctx = ctx
+        self.states[ctx] = 0
+
+    @property
+    def pstate(self) -> int:
+        return self.states[self.ctx]
+
+    @pstate.setter
+    def pstate(self, pstate: int):
+        self.states[self.ctx] = pstate
 
     def init(self):
         self.pstate = 0
@@ -80,11 +101,12 @@ class ProbModel:
         return 0.000030517578125 * float(EntropyBits[self.pstate ^ bin])
 
     def estBits(self, bin: int) -> float:
-        numBits: float = 0.000030517578125 * float(EntropyBits[self.pstate ^ bin])
-        if bin == self.mps():
-            self.pstate = NextStateMPS[self.pstate]
+        pstate: int = self.states[self.ctx]
+        numBits: float = 0.000030517578125 * float(EntropyBits[pstate ^ bin])
+        if bin == (pstate & 1):
+            self.states[self.ctx] = NextStateMPS[pstate]
         else:
-            self.pstate = NextStateLPS[self.pstate]
+            self.states[self.ctx] = NextStateLPS[pstate]
         return numBits
 
     def state(self) -> int:
@@ -1,5 +1,4 @@
-from arithBase import LPSTable
-from arithBase import RenormTable
+from arithBase import CodingTable
 
 
 # ----- arithmetic decoder  -----
@@ -19,38 +18,119 @@ class ArithDecoder:
     #  - decodes binary decision (bin) using specified probability model
     #  - updates probability model based on value of bin
     def decodeBin(self, probModel) -> int:
-        bin: int = probModel.mps()
-        LPS: int = LPSTable[probModel.state()][(self.range >> 6) - 4]
-        self.range -= LPS
-        scaledRange: int = self.range << 7
+        states = probModel.states
+        ctx: int = probModel.ctx
+        pstate: int = states[ctx]
+        bin: int = pstate & 1
+        # range is in [256, 510], so (range >> 6) & 3 == (range >> 6) - 4
+        LPS, numBits, nextStateMPS, nextStateLPS = CodingTable[(pstate << 2) | ((self.range >> 6) & 3)]
+        range: int = self.range - LPS
+        scaledRange: int = range << 7
         if self.value < scaledRange:
-            if scaledRange < (256 << 7):
-                self.range = scaledRange >> 6
+            states[ctx] = nextStateMPS
+            if range < 256:
+                self.range = range << 1
                 self.value += self.value
                 self.bitsNeeded += 1
                 if self.bitsNeeded == 0:
                     self.bitsNeeded = -8
                     self.value += self.bitstream.get_bits(8)
-            probModel.updateMPS()
-        else:
-            bin = 1 - bin
-            numBits: int = RenormTable[LPS >> 3]
-            self.value = (self.value - scaledRange) << numBits
-            self.range = LPS << numBits
-            self.bitsNeeded += numBits
-            if self.bitsNeeded >= 0:
-                self.value += (self.bitstream.get_bits(8) << self.bitsNeeded)
-                self.bitsNeeded -= 8
-            probModel.updateLPS()
-        return bin
+            else:
+                self.range = range
+            return bin
+        states[ctx] = nextStateLPS
+        self.value = (self.value - scaledRange) << numBits
+        self.range = LPS << numBits
+        self.bitsNeeded += numBits
+        if self.bitsNeeded >= 0:
+            self.value += (self.bitstream.get_bits(8) << self.bitsNeeded)
+            self.bitsNeeded -= 8
+        return 1 - bin
 
-    # wrapper for decode() to get multiple bins
+    # wrapper for decodeBin() to get multiple bins (same model),
+    # the decoder state is kept in local variables while decoding the bins
     def decodeBins(self, numBins: int, probModel) -> int:
-        value: int = 0
+        table = CodingTable
+        get_bits = self.bitstream.get_bits
+        states = probModel.states
+        ctx: int = probModel.ctx
+        pstate: int = states[ctx]
+        range: int = self.range
+        value: int = self.value
+        bitsNeeded: int = self.bitsNeeded
+        bins: int = 0
         while numBins:
             numBins -= 1
-            value = (value << 1) | self.decodeBin(probModel)
-        return value
+            LPS, numBits, nextStateMPS, nextStateLPS = table[(pstate << 2) | ((range >> 6) & 3)]
+            range -= LPS
+            scaledRange = range << 7
+            if value < scaledRange:
+                bins = (bins << 1) | (pstate & 1)
+                pstate = nextStateMPS
+                if range < 256:
+                    range <<= 1
+                    value += value
+                    bitsNeeded += 1
+                    if bitsNeeded == 0:
+                        bitsNeeded = -8
+                        value += get_bits(8)
+            else:
+                bins = (bins << 1) | (1 - (pstate & 1))
+                pstate = nextStateLPS
+                value = (value - scaledRange) << numBits
+                range = LPS << numBits
+                bitsNeeded += numBits
+                if bitsNeeded >= 0:
+                    value += get_bits(8) << bitsNeeded
+                    bitsNeeded -= 8
+        states[ctx] = pstate
+        self.range = range
+        self.value = value
+        self.bitsNeeded = bitsNeeded
+        return bins
+
+    # number of zero bins before the first one bin (all bins with the same model, e.g. exp-Golomb prefix),
+    # the decoder state is kept in local variables while decoding the bins
+    def decodeUnary(self, probModel) -> int:
+        table = CodingTable
+        get_bits = self.bitstream.get_bits
+        states = probModel.states
+        ctx: int = probModel.ctx
+        pstate: int = states[ctx]
+        range: int = self.range
+        value: int = self.value
+        bitsNeeded: int = self.bitsNeeded
+        numZeros: int = -1
+        bin: int = 0
+        while not bin:
+            numZeros += 1
+            LPS, numBits, nextStateMPS, nextStateLPS = table[(pstate << 2) | ((range >> 6) & 3)]
+            range -= LPS
+            scaledRange = range << 7
+            if value < scaledRange:
+                bin = pstate & 1
+                pstate = nextStateMPS
+                if range < 256:
+                    range <<= 1
+                    value += value
+                    bitsNeeded += 1
+                    if bitsNeeded == 0:
+                        bitsNeeded = -8
+                        value += get_bits(8)
+            else:
+                bin = 1 - (pstate & 1)
+                pstate = nextStateLPS
+                value = (value - scaledRange) << numBits
+                range = LPS << numBits
+                bitsNeeded += numBits
+                if bitsNeeded >= 0:
+                    value += get_bits(8) << bitsNeeded
+                    bitsNeeded -= 8
+        states[ctx] = pstate
+        self.range = range
+        self.value = value
+        self.bitsNeeded = bitsNeeded
+        return numZeros
 
     # bypass coding of a single bin
     def decodeBinEP(self) -> int:
@@ -65,33 +145,23 @@ class ArithDecoder:
             return 1
         return 0
 
-    # bypass coding of multiple bins
+    # bypass coding of multiple bins: the bins are the binary digits of value / (range << 7) after reading them
+    # into value (at most 8 at once), so every chunk of bins is obtained with one division
     def decodeBinsEP(self, numBins: int) -> int:
         value: int = 0
+        scaledRange: int = self.range << 7
         while numBins > 8:
-            self.value <<= 8
-            self.value += int(self.bitstream.get_bits(8) << (8 + self.bitsNeeded))
-            scaledRange: int = self.range << 15
-            for i in range(8):
-                value += value
-                scaledRange >>= 1
-                if self.value >= scaledRange:
-                    value += 1
-                    self.value -= scaledRange
+            self.value = (self.value << 8) + (self.bitstream.get_bits(8) << (8 + self.bitsNeeded))
+            bins, self.value = divmod(self.value, scaledRange)
+            value = (value << 8) | bins
             numBins -= 8
         self.bitsNeeded += numBins
         self.value <<= numBins
         if self.bitsNeeded >= 0:
-            self.value += int(self.bitstream.get_bits(8) << self.bitsNeeded)
+            self.value += self.bitstream.get_bits(8) << self.bitsNeeded
             self.bitsNeeded -= 8
-        scaledRange: int = self.range << (numBins + 7)
-        for i in range(numBins):
-            value += value
-            scaledRange >>= 1
-            if self.value >= scaledRange:
-                value += 1
-                self.value -= scaledRange
-        return value
+        bins, self.value = divmod(self.value, scaledRange)
+        return (value << numBins) | bins
 
     # finish (return value "true" indicates success)
     def finish(self) -> bool:
@@ -1,5 +1,5 @@
-from arithBase import LPSTable
-from arithBase import RenormTable
+from arithBase import BYPASS
+from arithBase import CodingTable
 
 
 # ----- arithmetic encoder  -----
@@ -21,28 +21,108 @@ class ArithEncoder:
     #  - encodes binary decision (bin) using specified probability model
     #  - updates probability model based on value of bin
     def encodeBin(self, bin: int, probModel):
-        LPS: int = LPSTable[probModel.state()][(self.range >> 6) & 3]
-        self.range -= LPS
-        if bin != probModel.mps():
-            numBits: int = RenormTable[LPS >> 3]
-            self.low = (self.low + self.range) << numBits
+        states = probModel.states
+        ctx: int = probModel.ctx
+        pstate: int = states[ctx]
+        LPS, numBits, nextStateMPS, nextStateLPS = CodingTable[(pstate << 2) | ((self.range >> 6) & 3)]
+        range: int = self.range - LPS
+        if bin != (pstate & 1):
+            self.low = (self.low + range) << numBits
             self.range = LPS << numBits
             self.bitsLeft -= numBits
-            self.__test_and_write_out()
-            probModel.updateLPS()
+            states[ctx] = nextStateLPS
         else:
-            if self.range < 256:
-                self.low <<= 1
-                self.range <<= 1
-                self.bitsLeft -= 1
-                self.__test_and_write_out()
-            probModel.updateMPS()
+            states[ctx] = nextStateMPS
+            if range >= 256:
+                self.range = range
+                return
+            self.low <<= 1
+            self.range = range << 1
+            self.bitsLeft -= 1
+        if self.bitsLeft < 12:
+            self.__write_out()
 
-    # wrapper for encodeBin() to handle multiple bins
+    # wrapper for encodeBin() to handle multiple bins (same model),
+    # the coder state is kept in local variables while coding the bins
     def encodeBins(self, pattern: int, numBins: int, probModel):
+        table = CodingTable
+        states = probModel.states
+        ctx: int = probModel.ctx
+        pstate: int = states[ctx]
+        low: int = self.low
+        range: int = self.range
+        bitsLeft: int = self.bitsLeft
         while numBins > 0:
             numBins -= 1
-            self.encodeBin((pattern >> numBins) & 1, probModel)
+            LPS, numBits, nextStateMPS, nextStateLPS = table[(pstate << 2) | ((range >> 6) & 3)]
+            range -= LPS
+            if ((pattern >> numBins) & 1) != (pstate & 1):
+                low = (low + range) << numBits
+                range = LPS << numBits
+                bitsLeft -= numBits
+                pstate = nextStateLPS
+            else:
+                pstate = nextStateMPS
+                if range >= 256:
+                    continue
+                low <<= 1
+                range <<= 1
+                bitsLeft -= 1
+            if bitsLeft < 12:
+                self.low, self.bitsLeft = low, bitsLeft
+                self.__write_out()
+                low, bitsLeft = self.low, self.bitsLeft
+        states[ctx] = pstate
+        self.low = low
+        self.range = range
+        self.bitsLeft = bitsLeft
+
+    # coding of a bin string (e.g. all bins of a block) in one call:
+    #  - bins = bin values, ctxIds = context id of each bin (index into states) or BYPASS
+    #  - states = context states (ContextModeler.states), updated while coding
+    #  - runs of bypass bins are coded with encodeBinsEP
+    def encodeBinString(self, bins, ctxIds, states):
+        table = CodingTable
+        low: int = self.low
+        range: int = self.range
+        bitsLeft: int = self.bitsLeft
+        numBins: int = len(bins)
+        i: int = 0
+        while i < numBins:
+            bin: int = bins[i]
+            ctx: int = ctxIds[i]
+            i += 1
+            if ctx == BYPASS:
+                start: int = i - 1
+                while i < numBins and ctxIds[i] == BYPASS:
+                    bin = (bin << 1) | bins[i]
+                    i += 1
+                self.low, self.range, self.bitsLeft = low, range, bitsLeft
+                self.encodeBinsEP(bin, i - start)
+                low, bitsLeft = self.low, self.bitsLeft
+                continue
+            pstate: int = states[ctx]
+            LPS, numBits, nextStateMPS, nextStateLPS = table[(pstate << 2) | ((range >> 6) & 3)]
+            range -= LPS
+            if bin != (pstate & 1):
+                low = (low + range) << numBits
+                range = LPS << numBits
+                bitsLeft -= numBits
+                states[ctx] = nextStateLPS
+            else:
+                states[ctx] = nextStateMPS
+                if range >= 256:
+                    continue
+                low <<= 1
+                range <<= 1
+                bitsLeft -= 1
+            if bitsLeft < 12:
+                self.low, self.bitsLeft = low, bitsLeft
+                self.__write_out()
+                low, bitsLeft = self.low, self.bitsLeft
+        self.low = low
+        self.range = range
+        self.bitsLeft = bitsLeft
 
     # bypass coding of a single bin
     def encodeBinEP(self, bin: int):
@@ -94,21 +174,25 @@ class ArithEncoder:
     # private method for output
     def __test_and_write_out(self):
         if self.bitsLeft < 12:
-            leadByte: int = self.low >> (24 - self.bitsLeft)
-            self.bitsLeft += 8
-            self.low &= (4294967295 >> self.bitsLeft)
-            if leadByte == 255:
-                self.numBufferedBytes += 1
-            else:
-                if self.numBufferedBytes > 0:
-                    carry: int = leadByte >> 8
-                    byte: int = self.bufferedByte + carry
-                    self.bufferedByte = leadByte & 255
+            self.__write_out()
+
+    # output of the leading byte of low (requires bitsLeft < 12)
+    def __write_out(self):
+        leadByte: int = self.low >> (24 - self.bitsLeft)
+        self.bitsLeft += 8
+        self.low &= (4294967295 >> self.bitsLeft)
+        if leadByte == 255:
+            self.numBufferedBytes += 1
+        else:
+            if self.numBufferedBytes > 0:
+                carry: int = leadByte >> 8
+                byte: int = self.bufferedByte + carry
+                self.bufferedByte = leadByte & 255
+                self.bitstream.addBits(byte, 8)
+                byte = (255 + carry) & 255
+                while self.numBufferedBytes > 1:
                     self.bitstream.addBits(byte, 8)
-                    byte = (255 + carry) & 255
-                    while self.numBufferedBytes > 1:
-                        self.bitstream.addBits(byte, 8)
-                        self.numBufferedBytes -= 1
-                else:
-                    self.numBufferedBytes = 1
-                    self.bufferedByte = leadByte
+                    self.numBufferedBytes -= 1
+            else:
+                self.numBufferedBytes = 1
+                self.bufferedByte = leadByte
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+import argparse
+import os
+import tempfile
+import time
+
+from Encoder import Encoder
+from MotionSearch import SEARCH_PATTERN_NAMES
+
+VIDEO_WIDTH = 416
+VIDEO_HEIGHT = 240
+DEFAULT_BLOCK_SIZE = 16
+DEFAULT_QP = 12
+DEFAULT_NO_OF_FRAMES = 10
+DEFAULT_SEARCH_RANGE = 8
+
+
+# Encodes the video once per search pattern and prints the number of evaluated motion vector candidates
+# per block and the encoding time. 'log' is the search of the original --fast mode, its 'lookups' column
+# is the number of candidates the recursive implementation evaluated (without the cost cache).
+def run_benchmark(input_path, width, height, block_size, qp, num_frames, search_range, patterns):
+    print(f'{"pattern":<15}{"points/block":>14}{"lookups/block":>15}{"ms/frame":>10}{"bytes":>10}')
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bitstream_path = os.path.join(tmp_dir, 'bitstream.bin')
+        for pattern in patterns:
+            enc = Encoder(input_path, bitstream_path, block_size, qp, True, search_pattern=pattern)
+            start_time = time.perf_counter()
+            enc.encode_video(width, height, num_frames, search_range)
+            encoding_time = time.perf_counter() - start_time
+
+            stats = enc.search_stats
+            num_blocks = max(1, stats['blocks'])
+            print(f'{pattern:<15}{stats["evaluated"] / num_blocks:>14.2f}{stats["lookups"] / num_blocks:>15.2f}'
+                  f'{encoding_time * 1000 / num_frames:>10.1f}{os.path.getsize(bitstream_path):>10}')
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Compares the search patterns of the fast motion vector search')
+    parser.add_argument('-i', '--input', dest='input', type=str,
+                        help='input video (8 bit luma only)', required=True)
+    parser.add_argument('-s', '--size', dest='video_size', type=str,
+                        help=f'video dimensions WxH (default: {VIDEO_WIDTH}x{VIDEO_HEIGHT})',
+                        default=f'{VIDEO_WIDTH}x{VIDEO_HEIGHT}')
+    parser.add_argument('-bs', '--block_size', dest='block_size', type=int,
+                        help=f'block size in samples (default: {DEFAULT_BLOCK_SIZE})',
+                        default=DEFAULT_BLOCK_SIZE)
+    parser.add_argument('-qp', '--quantization-parameter', dest='qp', type=int,
+                        help=f'quantization parameter (default: {DEFAULT_QP})',
+                        default=DEFAULT_QP)
+    parser.add_argument('-fr', '--frames', dest='num_frames', type=int,
+                        help=f'number of frames (default: {DEFAULT_NO_OF_FRAMES})',
+                        default=DEFAULT_NO_OF_FRAMES)
+    parser.add_argument('-sr', '--search_range', dest='search_range', type=int,
+                        help=f'search range in samples (default: {DEFAULT_SEARCH_RANGE})',
+                        default=DEFAULT_SEARCH_RANGE)
+    parser.add_argument('-p', '--patterns', dest='patterns', type=str,
+                        help='comma separated search patterns (default: all)',
+                        default=','.join(SEARCH_PATTERN_NAMES))
+
+    args = parser.parse_args()
+    return args
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    width, height = list(map(int, args.video_size.split('x')))
+    run_benchmark(args.input, width, height, args.block_size, args.qp, args.num_frames, args.search_range,
+                  args.patterns.split(','))
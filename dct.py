@@ -1,46 +1,125 @@
-# %% 
-from scipy.fftpack import dct, idct
+# %%
+from functools import lru_cache
+
 import numpy as np
-import matplotlib.pylab as plt 
 from PredictionCalculator import PredictionMode
 import math
 
-# %% 
+
+# orthonormal DCT-II matrix (same as scipy's dct with norm='ortho')
+def get_dct_ii_matrix(size_N):
+    n = np.arange(size_N)
+    matrix = math.sqrt(2 / size_N) * np.cos(math.pi * np.outer(n, 2 * n + 1) / (2 * size_N))
+    matrix[0] /= math.sqrt(2)
+    return matrix
+
+
+# orthonormal DST-VII matrix
+def get_dst_vii_matrix(size_N):
+    n = np.arange(size_N)
+    beta = math.sqrt(4 / (2 * size_N + 1))
+    return beta * np.sin(math.pi * ((2 * n + 1) / (2 * size_N + 1))[:, None] * (n + 1))
+
+
+# vertical and horizontal transform matrix of each prediction mode (indexed by PredictionMode), computed once
+# per block size and shared by all Transformation objects (read-only)
+@lru_cache(maxsize=None)
+def get_transform_matrices(blocksize):
+    dct_matrix = get_dct_ii_matrix(blocksize)
+    dst_matrix = get_dst_vii_matrix(blocksize)
+    vertical_matrices = np.empty([len(PredictionMode), blocksize, blocksize])
+    horizontal_matrices = np.empty([len(PredictionMode), blocksize, blocksize])
+    for mode, vertical, horizontal in [(PredictionMode.DC_PREDICTION, dct_matrix, dct_matrix),
+                                       (PredictionMode.VERTICAL_PREDICTION, dst_matrix, dct_matrix),
+                                       (PredictionMode.HORIZONTAL_PREDICTION, dct_matrix, dst_matrix),
+                                       (PredictionMode.PLANAR_PREDICTION, dst_matrix, dst_matrix)]:
+        vertical_matrices[mode] = vertical
+        horizontal_matrices[mode] = horizontal
+    vertical_matrices.setflags(write=False)
+    horizontal_matrices.setflags(write=False)
+    return vertical_matrices, horizontal_matrices
+
+
+# %%
+# Separable 2D transforms: coefficients = V @ block @ H.T, residual = V.T @ coefficients @ H with the vertical (V)
+# and horizontal (H) matrix of the prediction mode.
 class Transformation:
     def __init__(self, blocksize):
-        self.dst_matrix = self.get_dst_vii_matrix(blocksize)
-        self.dst_matrix_inverse = self.dst_matrix.T
-
-    def get_dst_vii_matrix(self,size_N):
-        matrix = []
-        beta = math.sqrt(4/(2*size_N+1))
-        for k in range(size_N):
-            b_k = []
-            for n in range(size_N):
-                b_k.append(beta* math.sin(math.pi* ((2*k + 1)/(2*size_N+1)) *(n+1)))
-            matrix.append(b_k)
-        return np.asarray(matrix)
+        self.vertical_matrices, self.horizontal_matrices = get_transform_matrices(blocksize)
+        # transposed matrices for the inverse transform
+        self.vertical_matrices_inverse = self.vertical_matrices.transpose(0, 2, 1)
+        self.horizontal_matrices_inverse = self.horizontal_matrices.transpose(0, 2, 1)
 
     def forward_transform(self, block, prediction_mode):
-        if prediction_mode == PredictionMode.PLANAR_PREDICTION:
-            return np.matmul(np.matmul(self.dst_matrix,block),self.dst_matrix_inverse)
-        elif prediction_mode == PredictionMode.DC_PREDICTION:
-            return dct(dct(block, axis=0, norm='ortho'), axis=1, norm='ortho')
-        elif prediction_mode == PredictionMode.HORIZONTAL_PREDICTION:
-            return np.matmul(dct(block, axis=0, norm='ortho'),self.dst_matrix_inverse)
-        elif prediction_mode == PredictionMode.VERTICAL_PREDICTION:
-            return dct(np.matmul(self.dst_matrix,block), axis=1, norm='ortho')
-
+        return self.vertical_matrices[prediction_mode] @ block @ self.horizontal_matrices_inverse[prediction_mode]
 
     def backward_transform(self, block, prediction_mode):
-        if prediction_mode == PredictionMode.PLANAR_PREDICTION:
-            rec_residual = np.matmul(np.matmul(self.dst_matrix_inverse,block),self.dst_matrix)
-        elif prediction_mode == PredictionMode.DC_PREDICTION:
-            rec_residual = idct(idct(block, axis=0, norm='ortho'), axis=1, norm='ortho')
-        elif prediction_mode == PredictionMode.HORIZONTAL_PREDICTION:
-            rec_residual = np.matmul(idct(block, axis=0, norm='ortho'),self.dst_matrix)
-        elif prediction_mode == PredictionMode.VERTICAL_PREDICTION:
-            rec_residual = idct(np.matmul(self.dst_matrix_inverse,block), axis=1, norm='ortho')
+        rec_residual = self.vertical_matrices_inverse[prediction_mode] @ block @ self.horizontal_matrices[prediction_mode]
         return np.rint(rec_residual).astype(int)
 
+    # Transforms a stack of blocks (..., B, B), e.g. (N, B, B) or all blocks of a block row or picture as
+    # (rows, columns, B, B). prediction_modes is one mode for all blocks or an array of modes (one per block).
+    def forward_transform_batch(self, blocks, prediction_modes):
+        vertical = self.vertical_matrices[prediction_modes]
+        horizontal = self.horizontal_matrices_inverse[prediction_modes]
+        return vertical @ blocks @ horizontal
+
+    def backward_transform_batch(self, blocks, prediction_modes):
+        vertical = self.vertical_matrices_inverse[prediction_modes]
+        horizontal = self.horizontal_matrices[prediction_modes]
+        return np.rint(vertical @ blocks @ horizontal).astype(int)
+
+
+# ===== integer transform =====
+# The basis matrices are the orthonormal matrices scaled by 2**INT_BASIS_BITS * sqrt(B) and rounded to integers,
+# both stages are normalized with rounding right shifts. Forward transform coefficients and the input of the
+# backward transform are integers with INT_COEFF_BITS fractional bits (see quantization.IntegerQuantizer), so the
+# reconstruction is exact integer arithmetic and identical on all platforms.
+INT_BASIS_BITS = 10
+INT_COEFF_BITS = 6
+
+
+@lru_cache(maxsize=None)
+def get_integer_transform_matrices(blocksize):
+    log2_size = blocksize.bit_length() - 1
+    if blocksize != 1 << log2_size or not 4 <= blocksize <= 64:
+        raise Exception('Transformation: Integer transform requires a block size of 4, 8, 16, 32 or 64')
+    scale = (1 << INT_BASIS_BITS) * math.sqrt(blocksize)
+    matrices = tuple(np.rint(matrix * scale).astype(np.int64) for matrix in get_transform_matrices(blocksize))
+    for matrix in matrices:
+        matrix.setflags(write=False)
+    return matrices
+
+
+def rounding_shift(values, shift):
+    return (values + (1 << (shift - 1))) >> shift
+
+
+# Same interface as Transformation on integer arrays. Each stage scales by 2**INT_BASIS_BITS * sqrt(B), the shifts
+# of both stages sum up to 2 * INT_BASIS_BITS + log2(B) -/+ INT_COEFF_BITS (forward/backward).
+class IntegerTransformation:
+    def __init__(self, blocksize):
+        self.vertical_matrices, self.horizontal_matrices = get_integer_transform_matrices(blocksize)
+        self.vertical_matrices_inverse = self.vertical_matrices.transpose(0, 2, 1)
+        self.horizontal_matrices_inverse = self.horizontal_matrices.transpose(0, 2, 1)
+        log2_size = blocksize.bit_length() - 1
+        self.forward_shifts = (log2_size - 1, 2 * INT_BASIS_BITS + 1 - INT_COEFF_BITS)
+        self.backward_shifts = (INT_BASIS_BITS + 1, INT_BASIS_BITS + INT_COEFF_BITS - 1 + log2_size)
+
+    def forward_transform(self, block, prediction_mode):
+        return self.forward_transform_batch(block, prediction_mode)
+
+    def backward_transform(self, block, prediction_mode):
+        return self.backward_transform_batch(block, prediction_mode)
+
+    def forward_transform_batch(self, blocks, prediction_modes):
+        vertical = self.vertical_matrices[prediction_modes]
+        horizontal = self.horizontal_matrices_inverse[prediction_modes]
+        first_shift, second_shift = self.forward_shifts
+        return rounding_shift(rounding_shift(vertical @ blocks, first_shift) @ horizontal, second_shift)
 
+    def backward_transform_batch(self, blocks, prediction_modes):
+        vertical = self.vertical_matrices_inverse[prediction_modes]
+        horizontal = self.horizontal_matrices[prediction_modes]
+        first_shift, second_shift = self.backward_shifts
+        return rounding_shift(rounding_shift(vertical @ blocks, first_shift) @ horizontal, second_shift)
@@ -20,11 +20,31 @@ def main():
                         help='if set write output as PGM image',
                         action='store_true',
                         dest='pgm')
+    parser.add_argument('-x', '--index',
+                        help='frame index written by the encoder (speeds up --start-frame)',
+                        default=None,
+                        dest='index_path')
+    parser.add_argument('-sf', '--start-frame',
+                        help='first frame to be output (default: 0)',
+                        default=0,
+                        dest='start_frame',
+                        type=int)
+    parser.add_argument('-n', '--n-frames',
+                        help='number of frames to be output (default: all)',
+                        default=None,
+                        dest='n_frames',
+                        type=int)
+    parser.add_argument('-j', '--jobs',
+                        help='number of processes decoding the tiles of intra frames or the block rows of wavefront '
+                             'coded frames in parallel (default: 1)',
+                        default=1,
+                        dest='n_workers',
+                        type=int)
     args = parser.parse_args()
 
     start_time = time.process_time()  # benchmarking speed
-    dec = Decoder(args.bitstream, args.output, args.pgm)
-    dec.decode_all_frames()
+    dec = Decoder(args.bitstream, args.output, args.pgm, index_path=args.index_path, n_workers=args.n_workers)
+    dec.decode_all_frames(args.start_frame, args.n_frames)
     decoding_time = time.process_time() - start_time
     print(f'it took {decoding_time * 1000} ms to decode')
 
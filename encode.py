@@ -4,6 +4,9 @@ import argparse
 import time
 
 from Encoder import Encoder
+from MotionSearch import SEARCH_PATTERN_NAMES
+from PredictionCalculator import INTERPOLATION_FILTERS
+import rawvideo
 
 
 def main():
@@ -20,7 +23,7 @@ def main():
                         dest='qp',
                         type=int)
     parser.add_argument('-i', '--input',
-                        help='input image in pgm format or input video',
+                        help='input image in pgm format or input video (raw 8 bit, "-" reads the video from stdin)',
                         required=True,
                         dest='input', )
     parser.add_argument('-b', '--bitstream',
@@ -40,6 +43,49 @@ def main():
                         default=30,
                         dest='n_frames',
                         type=int)
+    parser.add_argument('-sf', '--start-frame',
+                        help='Index of the first frame to be encoded (video only, default: 0)',
+                        default=0,
+                        dest='start_frame',
+                        type=int)
+    parser.add_argument('-cf', '--chroma-format',
+                        help='Chroma format of the input video, only the luma plane is encoded (default: 400)',
+                        default='400',
+                        choices=rawvideo.CHROMA_FORMATS,
+                        dest='chroma_format')
+    parser.add_argument('-ip', '--intra-period',
+                        help='Code every N-th frame as intra frame (video only, default: 0 = first frame only)',
+                        default=0,
+                        dest='intra_period',
+                        type=int)
+    parser.add_argument('-x', '--index',
+                        help='path for the frame index used for random access by the decoder (video only)',
+                        default=None,
+                        dest='index_path')
+    parser.add_argument('-j', '--jobs',
+                        help='Number of processes encoding block rows (--wavefront), GOPs (video, requires '
+                             '--intra-period) or tiles (image) in parallel (default: 1)',
+                        default=1,
+                        dest='n_workers',
+                        type=int)
+    parser.add_argument('-t', '--tiles',
+                        help='Partitioning of intra frames into CxR independently coded tiles (default: 1x1)',
+                        default='1x1',
+                        dest='tiles',
+                        type=str)
+    parser.add_argument('-wpp', '--wavefront',
+                        help='Code the block rows in wavefront order (parallel with --jobs, no tiles)',
+                        dest='wavefront',
+                        action='store_true')
+    parser.add_argument('-sg', '--sign-grouping',
+                        help='Write the signs of all coefficients of a block after its last coefficient',
+                        dest='sign_grouping',
+                        action='store_true')
+    parser.add_argument('-it', '--integer-transform',
+                        help='Use the integer transform and quantization (exact reconstruction on all platforms, '
+                             'block sizes 4 to 64)',
+                        dest='integer_transform',
+                        action='store_true')
     parser.add_argument('-sr', '--search-range',
                         help='Specify search range S',
                         default=8,
@@ -50,16 +96,48 @@ def main():
                         help='Use logarithmic motion vector search',
                         dest='use_fast',
                         action='store_true')
+    parser.add_argument('-fse', '--full-search-engine',
+                        help='Implementation of the full motion vector search: "volume" precomputes the SADs of '
+                             'all blocks of a frame, "batched" evaluates all candidates of a block at once, '
+                             '"loop" evaluates them one by one (default: batched)',
+                        default='batched',
+                        choices=('volume', 'batched', 'loop'),
+                        dest='full_search_engine')
+    parser.add_argument('-sp', '--search-pattern',
+                        help='Search pattern of the fast motion vector search (default: log)',
+                        default='log',
+                        choices=SEARCH_PATTERN_NAMES,
+                        dest='search_pattern')
+    parser.add_argument('-qpel', '--quarter-sample',
+                        help='Use motion vectors with quarter-sample precision',
+                        dest='quarter_sample',
+                        action='store_true')
+    parser.add_argument('-if', '--interpolation-filter',
+                        help='Filter for the half-sample interpolation of the reference frame (default: bilinear)',
+                        default='bilinear',
+                        choices=INTERPOLATION_FILTERS,
+                        dest='interpolation_filter')
+    parser.add_argument('-ar', '--approximate-rate',
+                        help='Estimate the bits of a block with the context states frozen at the start of the block '
+                             '(faster, less accurate mode decision)',
+                        dest='approximate_rate',
+                        action='store_true')
 
     args = parser.parse_args()
 
+    tile_columns, tile_rows = list(map(int, args.tiles.split('x')))
+
     start_time = time.process_time()  # benchmarking speed
-    enc = Encoder(args.input, args.bitstream, args.blocksize, args.qp, args.use_fast, args.reconstruction_path)
+    enc = Encoder(args.input, args.bitstream, args.blocksize, args.qp, args.use_fast, args.reconstruction_path,
+                  args.full_search_engine, args.search_pattern, args.quarter_sample,
+                  args.interpolation_filter, not args.approximate_rate, None, tile_columns, tile_rows,
+                  args.wavefront, args.sign_grouping, args.integer_transform)
     if args.video_size is None:
-        enc.encode_image()
+        enc.encode_image(args.n_workers)
     else:
         width, height = list(map(int, args.video_size.split('x')))  # Parse width and height and cast to int
-        enc.encode_video(width, height, args.n_frames, args.search_range)
+        enc.encode_video(width, height, args.n_frames, args.search_range, args.start_frame, args.chroma_format,
+                         args.intra_period, args.index_path, args.n_workers)
     encoding_time = time.process_time() - start_time
     print(f'it took {encoding_time * 1000} ms to encode')
 
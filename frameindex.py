@@ -0,0 +1,38 @@
+import numpy as np
+
+# Side file with the byte offsets of all frames of a bitstream (every frame starts byte aligned with a new
+# arithmetic codeword), used by the decoder to jump to intra frames without decoding the frames before them.
+#   magic 'IVCI', number of frames (32 bit), offsets (64 bit each), all big endian
+MAGIC = b'IVCI'
+
+
+# the first frame and every intra_period-th frame are intra frames (intra_period 0: only the first frame)
+def is_intra_frame(frame_number: int, intra_period: int) -> bool:
+    if intra_period == 0:
+        return frame_number == 0
+    return frame_number % intra_period == 0
+
+
+# last intra frame at or before frame_number
+def intra_frame_before(frame_number: int, intra_period: int) -> int:
+    if intra_period == 0:
+        return 0
+    return frame_number - frame_number % intra_period
+
+
+def write_index(path, frame_offsets):
+    with open(path, 'wb') as file:
+        file.write(MAGIC)
+        file.write(len(frame_offsets).to_bytes(4, 'big'))
+        file.write(np.asarray(frame_offsets, dtype='>u8').tobytes())
+
+
+def read_index(path) -> list:
+    with open(path, 'rb') as file:
+        if file.read(4) != MAGIC:
+            raise Exception('FrameIndex: No frame index file')
+        n_frames = int.from_bytes(file.read(4), 'big')
+        offsets = np.fromfile(file, dtype='>u8', count=n_frames)
+    if offsets.size != n_frames:
+        raise Exception('FrameIndex: Frame index file is corrupted')
+    return offsets.tolist()
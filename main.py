@@ -19,6 +19,9 @@ def parse_args():
                         help='optional: if set, curves for blocksizes [4,8,16,32] are computed')
     parser.add_argument('-print', dest='print', action='store_true',
                         help='optional: if set, no new data is computed but version curves are plotted')
+    parser.add_argument('-j', '--jobs', dest='n_jobs', type=int, default=1,
+                        help='optional: number of processes encoding the (block size, QP) combinations in parallel, '
+                             '-1 for one per core (default: 1)')
 
     args = parser.parse_args()
     return args
@@ -28,17 +31,17 @@ def main():
     args = parse_args()
     if args.bs:
         versions = args.versions.split(',') if args.versions else []
-        for block_size in [4, 8, 16, 32]:
-            version = args.version + "_bs-" + str(block_size)
-            if not args.print:
-                generate_data(args.filename, version, block_size)
+        block_size_versions = {block_size: args.version + "_bs-" + str(block_size) for block_size in [4, 8, 16, 32]}
+        if not args.print:
+            generate_data_sweep([args.filename], block_size_versions, args.n_jobs)
+        for block_size, version in block_size_versions.items():
             if not block_size == 32:
                 versions += [version]
         versions = ','.join(versions)
         plot_data(args.filename, version, versions)
     else:
         if not args.print:
-            generate_data(args.filename, args.version, 16)
+            generate_data(args.filename, args.version, 16, args.n_jobs)
         plot_data(args.filename, args.version, args.versions)
 
 
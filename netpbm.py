@@ -0,0 +1,73 @@
+from collections import namedtuple
+
+import numpy as np
+
+# Reading and writing of binary Netpbm images (P5: PGM, P6: PPM)
+PnmHeader = namedtuple('PnmHeader', ['magic', 'width', 'height', 'maxval', 'offset'])
+
+CHANNELS = {b'P5': 1, b'P6': 3}
+WHITESPACE = b' \t\n\r\v\f'
+
+
+def read_header(file) -> PnmHeader:
+    magic = file.read(2)
+    if magic not in CHANNELS:
+        raise Exception('Netpbm: No PGM/PPM image')
+
+    # width, height and maxval are separated by whitespace, comments start with '#' and end at the line end
+    values = []
+    byte = file.read(1)
+    while len(values) < 3:
+        if not byte:
+            raise Exception('Netpbm: Image header is corrupted')
+        if byte == b'#':
+            while byte and byte not in b'\r\n':
+                byte = file.read(1)
+        elif byte in WHITESPACE:
+            byte = file.read(1)
+        elif byte.isdigit():
+            token = b''
+            while byte and byte.isdigit():
+                token += byte
+                byte = file.read(1)
+            values.append(int(token))
+        else:
+            raise Exception('Netpbm: Image header is corrupted')
+
+    # exactly one whitespace character separates the header from the raster (already read)
+    if not byte or byte not in WHITESPACE:
+        raise Exception('Netpbm: Image header is corrupted')
+    width, height, maxval = values
+    if not 0 < maxval < 65536:
+        raise Exception('Netpbm: Unsupported maxval')
+    return PnmHeader(magic, width, height, maxval, file.tell())
+
+
+def sample_dtype(maxval: int):
+    # samples with more than 8 bits are stored big endian
+    return np.dtype(np.uint8) if maxval < 256 else np.dtype('>u2')
+
+
+# returns the image as array of shape (height, width) for PGM or (height, width, 3) for PPM and its header,
+# with use_mmap the raster is memory-mapped instead of read
+def read_image(path, use_mmap=False):
+    with open(path, 'rb') as file:
+        header = read_header(file)
+        channels = CHANNELS[header.magic]
+        shape = (header.height, header.width, channels) if channels > 1 else (header.height, header.width)
+        dtype = sample_dtype(header.maxval)
+        count = header.width * header.height * channels
+        if use_mmap:
+            if header.offset + count * dtype.itemsize > file.seek(0, 2):
+                raise Exception('Netpbm: Image is corrupted')
+            image = np.memmap(path, dtype=dtype, mode='r', offset=header.offset, shape=shape)
+        else:
+            image = np.fromfile(file, dtype=dtype, count=count)
+            if image.size != count:
+                raise Exception('Netpbm: Image is corrupted')
+            image = image.reshape(shape)
+    return image, header
+
+
+def write_header(file, width: int, height: int, maxval: int = 255, magic: bytes = b'P5'):
+    file.write(magic + f'\n{width} {height}\n{maxval}\n'.encode())
@@ -0,0 +1,43 @@
+import numpy as np
+
+from dct import INT_COEFF_BITS
+
+# Scalar quantization of the transform coefficients with step size qs = 2**(qp / 4) and a rounding offset of 0.4
+# (levels = sign(c) * floor(|c| / qs + 0.4), reconstruction = levels * qs).
+QUANT_OFFSET = 0.4
+
+
+# floating point coefficients (Transformation)
+class Quantizer:
+    def __init__(self, qp: int):
+        self.qs = 2 ** (qp / 4)
+
+    def quantize(self, coeffs):
+        return (np.sign(coeffs) * np.floor((np.abs(coeffs) / self.qs) + QUANT_OFFSET)).astype('int')
+
+    def dequantize(self, levels):
+        return levels * self.qs
+
+
+# Integer coefficients with INT_COEFF_BITS fractional bits (IntegerTransformation). The step size is split into
+# 2**(qp // 4), applied as shift, and 2**((qp % 4) / 4), applied as integer multiplication with the tables below.
+QUANT_BITS = 14
+QUANT_SCALES = [round(2 ** QUANT_BITS * 2 ** (-rem / 4)) for rem in range(4)]  # 2**14 / 2**(rem / 4)
+DEQUANT_SCALES = [round(2 ** INT_COEFF_BITS * 2 ** (rem / 4)) for rem in range(4)]  # 2**6 * 2**(rem / 4)
+
+
+class IntegerQuantizer:
+    def __init__(self, qp: int):
+        self.qs = 2 ** (qp / 4)
+        self.scale = QUANT_SCALES[qp % 4]
+        self.shift = QUANT_BITS + INT_COEFF_BITS + qp // 4
+        self.offset = round(QUANT_OFFSET * (1 << self.shift))
+        self.dequant_scale = DEQUANT_SCALES[qp % 4] << (qp // 4)
+
+    def quantize(self, coeffs):
+        levels = (np.abs(coeffs) * self.scale + self.offset) >> self.shift
+        return np.where(coeffs < 0, -levels, levels)
+
+    def dequantize(self, levels):
+        return levels.astype(np.int64) * self.dequant_scale
+
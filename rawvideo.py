@@ -0,0 +1,132 @@
+import sys
+
+import numpy as np
+
+import netpbm
+
+# Streaming reader and writer for raw planar 8-bit video (.y, .yuv): frames are read and written one at a time
+# (only the luma plane), so memory use does not depend on the length of the sequence.
+CHROMA_FORMATS = ('400', '420', '422', '444')
+
+
+def chroma_size(width: int, height: int, chroma_format: str) -> int:
+    # size of both chroma planes of a frame in bytes
+    if chroma_format == '400':
+        return 0
+    if chroma_format == '420':
+        return 2 * ((width + 1) // 2) * ((height + 1) // 2)
+    if chroma_format == '422':
+        return 2 * ((width + 1) // 2) * height
+    if chroma_format == '444':
+        return 2 * width * height
+    raise Exception('RawVideo: Unknown chroma format ' + str(chroma_format))
+
+
+def is_seekable(file) -> bool:
+    try:
+        return file.seekable()
+    except (AttributeError, OSError, ValueError):
+        return False
+
+
+# reads exactly size bytes, returns None at the end of the stream (pipes may deliver less than requested per read)
+def read_exact(file, size: int):
+    data = bytearray(size)
+    view = memoryview(data)
+    filled = 0
+    while filled < size:
+        n = file.readinto(view[filled:])
+        if not n:
+            break
+        filled += n
+    if filled == 0:
+        return None
+    if filled < size:
+        raise Exception('RawVideo: Incomplete frame at end of stream')
+    return data
+
+
+def skip(file, size: int):
+    if size == 0:
+        return
+    if is_seekable(file):
+        file.seek(size, 1)
+    else:
+        while size > 0:
+            chunk = file.read(min(size, 1 << 20))
+            if not chunk:
+                break
+            size -= len(chunk)
+
+
+# Yields the luma planes (height, width) of n_frames frames starting at frame start_frame (all remaining frames
+# if n_frames is None). source is a file name, '-' for stdin or a readable binary file object (e.g. a pipe).
+def read_frames(source, width: int, height: int, n_frames=None, start_frame: int = 0, chroma_format: str = '400'):
+    luma_size = width * height
+    frame_size = luma_size + chroma_size(width, height, chroma_format)
+    owns_file = False
+    if source == '-':
+        file = sys.stdin.buffer
+    elif hasattr(source, 'readinto'):
+        file = source
+    else:
+        file = open(source, 'rb')
+        owns_file = True
+    try:
+        skip(file, start_frame * frame_size)
+        count = 0
+        while n_frames is None or count < n_frames:
+            data = read_exact(file, luma_size)
+            if data is None:
+                break
+            skip(file, frame_size - luma_size)
+            yield np.frombuffer(data, dtype=np.uint8).reshape(height, width)
+            count += 1
+    finally:
+        if owns_file:
+            file.close()
+
+
+# Writes (padded) frames as soon as they are finished. target is a file name, '-' for stdout or a writable binary
+# file object; with pgm a PGM header is written first (single image). Additionally every cropped frame is passed to
+# frame_callback (e.g. queue.put), target may be None to use only the callback.
+class FrameWriter:
+    def __init__(self, target, width: int, height: int, pgm: bool = False, frame_callback=None):
+        self.width = width
+        self.height = height
+        self.frame_callback = frame_callback
+        self.owns_file = False
+        if target is None:
+            self.file = None
+        elif target == '-':
+            self.file = sys.stdout.buffer
+        elif hasattr(target, 'write'):
+            self.file = target
+        else:
+            self.file = open(target, 'wb')
+            self.owns_file = True
+        if pgm and self.file is not None:
+            netpbm.write_header(self.file, width, height)
+        self.n_frames = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def write(self, frame: np.ndarray):
+        # padding is removed directly before output
+        frame = frame[:self.height, :self.width]
+        if self.file is not None:
+            self.file.write(np.ascontiguousarray(frame).data)
+        if self.frame_callback is not None:
+            self.frame_callback(frame.copy())
+        self.n_frames += 1
+
+    def close(self):
+        if self.owns_file:
+            self.file.close()
+        elif self.file is not None:
+            self.file.flush()
+        self.file = None
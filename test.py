@@ -3,6 +3,7 @@ import subprocess
 import pandas as pd
 import os
 import matplotlib.pyplot as plt
+from joblib import Parallel, delayed
 
 
 from Encoder import Encoder as Encoder
@@ -23,41 +24,59 @@ BITSTREAM_SUFFIX = '.txt'
 DATA_SUFFIX = '.dat'
 
 
-def generate_data(filename, version, block_size=16):
+QUALITIES = [8, 12, 16, 20, 24]
+
+
+# every job gets its own bitstream and reconstruction, so jobs can run in parallel
+def job_paths(filename, block_size, quality):
+    name = filename + '_bs' + str(block_size) + '_qp' + str(quality)
+    return (os.path.join(BITSTREAM_PATH, name + BITSTREAM_SUFFIX),
+            os.path.join(PGM_RECONSTRUCTION_PATH, name + PGM_SUFFIX))
+
+
+# encodes and decodes one image with one block size and QP, returns bits per pixel and PSNR
+def run_job(filename, block_size, quality):
     input_path = os.path.join(PGM_ORIGINAL_PATH, filename + PGM_SUFFIX)
+    bitstream_path, output_path = job_paths(filename, block_size, quality)
 
-    if not os.path.exists(BITSTREAM_PATH):
-        os.mkdir(BITSTREAM_PATH)
-    bitstream_path = os.path.join(BITSTREAM_PATH, filename + BITSTREAM_SUFFIX)
+    enc = Encoder(input_path, bitstream_path, block_size, quality, False)
+    enc.encode_image()
+    dec = Decoder(bitstream_path, output_path, pgm=True)
+    dec.decode_all_frames()
 
-    if not os.path.exists(PGM_RECONSTRUCTION_PATH):
-        os.mkdir(PGM_RECONSTRUCTION_PATH)
-    output_path = os.path.join(PGM_RECONSTRUCTION_PATH, filename + PGM_SUFFIX)
+    process = subprocess.run(
+        [PSNR_TOOL_PATH, input_path, output_path, bitstream_path],
+        stdout=subprocess.PIPE,
+    )
 
-    df = pd.DataFrame(columns=['bpp', 'db'])
+    stdout = process.stdout.decode("utf-8")
+    bpp, db = stdout.split(' bpp ')
+    bpp, db = float(bpp), float(db.replace(' dB', ''))
+    db = 0.0 if math.isinf(db) else db
+    return bpp, db
 
-    for index, quality in enumerate([8, 12, 16, 20, 24]):
-        enc = Encoder(input_path, bitstream_path, block_size, quality, False)
-        enc.encode_image()
-        dec = Decoder(bitstream_path, output_path, pgm=True)
-        dec.decode_all_frames()
 
-        process = subprocess.run(
-            [PSNR_TOOL_PATH, input_path, output_path, bitstream_path],
-            stdout=subprocess.PIPE,
-        )
+# RD sweep over all (file, block size, QP) combinations in n_jobs processes (-1: one per core),
+# versions maps each block size to the version name its curves are stored under (one .dat file per file and version)
+def generate_data_sweep(filenames, versions, n_jobs=1):
+    for path in [BITSTREAM_PATH, PGM_RECONSTRUCTION_PATH, DATA_ROOT_PATH]:
+        os.makedirs(path, exist_ok=True)
 
-        stdout = process.stdout.decode("utf-8")
-        bpp, db = stdout.split(' bpp ')
-        bpp, db = float(bpp), float(db.replace(' dB', ''))
-        db = 0.0 if math.isinf(db) else db
-        df.loc[index] = [bpp, db]
+    jobs = [(filename, block_size, quality) for filename in filenames for block_size in versions for quality in QUALITIES]
+    results = Parallel(n_jobs=n_jobs)(delayed(run_job)(*job) for job in jobs)
 
-    version_path = os.path.join(DATA_ROOT_PATH, version)
-    print(version)
-    if not os.path.exists(version_path):
-        os.mkdir(version_path)
-    df.to_pickle(os.path.join(version_path, filename + DATA_SUFFIX))
+    for index in range(0, len(jobs), len(QUALITIES)):
+        filename, block_size, _ = jobs[index]
+        df = pd.DataFrame(results[index:index + len(QUALITIES)], columns=['bpp', 'db'])
+
+        version_path = os.path.join(DATA_ROOT_PATH, versions[block_size])
+        print(versions[block_size])
+        os.makedirs(version_path, exist_ok=True)
+        df.to_pickle(os.path.join(version_path, filename + DATA_SUFFIX))
+
+
+def generate_data(filename, version, block_size=16, n_jobs=1):
+    generate_data_sweep([filename], {block_size: version}, n_jobs)
 
 
 def parse_jpeg_data():
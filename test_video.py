@@ -4,6 +4,7 @@ import pandas as pd
 import os
 import matplotlib.pyplot as plt
 import argparse
+from joblib import Parallel, delayed
 
 
 from Encoder import Encoder as Encoder
@@ -31,49 +32,63 @@ DEFAULT_NO_OF_FRAMES = 30
 DEFAULT_SEARCH_RANGE = 8
 USE_FAST_SEARCH = True
 
-def generate_data(filename, version, block_size, num_frames, search_range):
+QUALITIES = [8, 12, 16, 20, 24]
+
+
+# every job gets its own bitstream and reconstruction, so jobs can run in parallel
+def job_paths(filename, block_size, quality, num_frames, search_range):
+    name = (filename
+            + "_bs" + str(block_size)
+            + "_fr" + str(num_frames)
+            + "_sr" + str(search_range)
+            + "_qp" + str(quality))
+    return (os.path.join(BITSTREAM_PATH, name + BITSTREAM_SUFFIX),
+            os.path.join(VIDEO_RECONSTRUCTION_PATH, name + VIDEO_SUFFIX))
+
+
+# encodes and decodes one video with one block size and QP, returns bits per pixel and PSNR
+def run_job(filename, block_size, quality, num_frames, search_range):
     input_path = os.path.join(VIDEO_ORIGINAL_PATH, filename + VIDEO_SUFFIX)
+    bitstream_path, output_path = job_paths(filename, block_size, quality, num_frames, search_range)
+
+    enc = Encoder(input_path, bitstream_path, block_size, quality, USE_FAST_SEARCH)
+    enc.encode_video(VIDEO_WIDTH, VIDEO_HEIGHT, num_frames, search_range)
+    dec = Decoder(bitstream_path, output_path, pgm=False)
+    dec.decode_all_frames()
+    # ./psnrRaw (width) (height) (format) (orgVideo) (recVideo) (bitstream) (fps)
+    process = subprocess.run(
+        [VIDEO_PSNR_TOOL_PATH, str(VIDEO_WIDTH),str(VIDEO_HEIGHT), "400", input_path, output_path, bitstream_path, str(VIDEO_FRAME_RATE)],
+        stdout=subprocess.PIPE,
+    )
+
+    stdout = process.stdout.decode("utf-8")
+    out = (stdout.split('\n\n')[2]).split()
+    bpp, db = float(out[0]), float(out[1])
+    db = 0.0 if math.isinf(db) else db
+    print("tested", bpp, db)
+    return bpp, db
+
 
-    if not os.path.exists(BITSTREAM_PATH):
-        os.mkdir(BITSTREAM_PATH)
-    bitstream_path = os.path.join(BITSTREAM_PATH, filename
-                                  + "_bs" + str(block_size)
-                                  + "_fr" + str(num_frames)
-                                  + "_sr" + str(search_range)
-                                  + BITSTREAM_SUFFIX)
-
-    if not os.path.exists(VIDEO_RECONSTRUCTION_PATH):
-        os.mkdir(VIDEO_RECONSTRUCTION_PATH)
-    output_path = os.path.join(VIDEO_RECONSTRUCTION_PATH, filename
-                               + "_bs" + str(block_size)
-                               + "_fr" + str(num_frames)
-                               + "_sr" + str(search_range)
-                               + VIDEO_SUFFIX)
-
-    df = pd.DataFrame(columns=['bpp', 'db'])
-
-    for index, quality in enumerate([8,12,16,20,24]):
-        enc = Encoder(input_path, bitstream_path, block_size, quality, USE_FAST_SEARCH)
-        enc.encode_video(VIDEO_WIDTH, VIDEO_HEIGHT, num_frames, search_range)
-        dec = Decoder(bitstream_path, output_path, pgm=False)
-        dec.decode_all_frames()
-        # ./psnrRaw (width) (height) (format) (orgVideo) (recVideo) (bitstream) (fps)
-        process = subprocess.run(
-            [VIDEO_PSNR_TOOL_PATH, str(VIDEO_WIDTH),str(VIDEO_HEIGHT), "400", input_path, output_path, bitstream_path, str(VIDEO_FRAME_RATE)],
-            stdout=subprocess.PIPE,
-        )
-
-        stdout = process.stdout.decode("utf-8")
-        out = (stdout.split('\n\n')[2]).split()
-        bpp, db = float(out[0]), float(out[1])
-        db = 0.0 if math.isinf(db) else db
-        print("tested", bpp, db)
-        df.loc[index] = [bpp, db]
-
-    version_path = os.path.join(DATA_ROOT_PATH, version)
-    if not os.path.exists(version_path):
-        os.mkdir(version_path)
-    df.to_pickle(os.path.join(version_path, filename + DATA_SUFFIX))
+# RD sweep over all (file, block size, QP) combinations in n_jobs processes (-1: one per core),
+# versions maps each block size to the version name its curves are stored under (one .dat file per file and version)
+def generate_data_sweep(filenames, versions, num_frames, search_range, n_jobs=1):
+    for path in [BITSTREAM_PATH, VIDEO_RECONSTRUCTION_PATH, DATA_ROOT_PATH]:
+        os.makedirs(path, exist_ok=True)
+
+    jobs = [(filename, block_size, quality) for filename in filenames for block_size in versions for quality in QUALITIES]
+    results = Parallel(n_jobs=n_jobs)(delayed(run_job)(*job, num_frames, search_range) for job in jobs)
+
+    for index in range(0, len(jobs), len(QUALITIES)):
+        filename, block_size, _ = jobs[index]
+        df = pd.DataFrame(results[index:index + len(QUALITIES)], columns=['bpp', 'db'])
+
+        version_path = os.path.join(DATA_ROOT_PATH, versions[block_size])
+        os.makedirs(version_path, exist_ok=True)
+        df.to_pickle(os.path.join(version_path, filename + DATA_SUFFIX))
+
+
+def generate_data(filename, version, block_size, num_frames, search_range, n_jobs=1):
+    generate_data_sweep([filename], {block_size: version}, num_frames, search_range, n_jobs)
 
 
 def plot_data(filename, version, versions):
@@ -119,6 +134,11 @@ def parse_args():
                         default=DEFAULT_SEARCH_RANGE,
                         dest='search_range',
                         type=int)
+    parser.add_argument('-j', '--jobs',
+                        help='number of processes encoding the QPs in parallel, -1 for one per core (default: 1)',
+                        default=1,
+                        dest='n_jobs',
+                        type=int)
 
     args = parser.parse_args()
     return args
@@ -126,7 +146,7 @@ def parse_args():
 if __name__ == '__main__':
     args = parse_args()
     if not args.print:
-        generate_data(args.filename, args.version, args.block_size, args.num_frames, args.search_range)
+        generate_data(args.filename, args.version, args.block_size, args.num_frames, args.search_range, args.n_jobs)
     plot_data(args.filename, args.version, args.versions)
 
 
@@ -0,0 +1,16 @@
+# Partitioning of intra frames into a grid of tiles. Each tile is coded with its own arithmetic codeword and the
+# intra prediction treats the tile border like the picture border, so the tiles can be coded independently.
+MAX_TILES = 255  # per direction, signalled with 8 bits
+
+
+# tiles (x, y, width, height) in coding order (row by row) for a frame of coded_width x coded_height samples,
+# tile borders are aligned to the block grid and distributed as uniformly as possible
+def get_tile_rects(coded_width: int, coded_height: int, block_size: int, columns: int, rows: int):
+    blocks_x = coded_width // block_size
+    blocks_y = coded_height // block_size
+    if not (1 <= columns <= min(blocks_x, MAX_TILES) and 1 <= rows <= min(blocks_y, MAX_TILES)):
+        raise Exception('Tiling: Invalid number of tiles')
+    x_bounds = [(i * blocks_x // columns) * block_size for i in range(columns + 1)]
+    y_bounds = [(i * blocks_y // rows) * block_size for i in range(rows + 1)]
+    return [(x_bounds[c], y_bounds[r], x_bounds[c + 1] - x_bounds[c], y_bounds[r + 1] - y_bounds[r])
+            for r in range(rows) for c in range(columns)]
@@ -0,0 +1,89 @@
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+# Wavefront parallel processing: every block row of a frame is coded with its own arithmetic codeword, which starts
+# with the context states of the row above after its first CONTEXT_LAG blocks. Block x of a row is coded when the
+# row above has finished block x + 1 (left, above and above-right neighbours are available, see get_mv_pred), so
+# the rows can be coded in parallel with a lag of two blocks.
+CONTEXT_LAG = 2
+WAIT_INTERVAL = 0.0002  # seconds between two checks of the progress of the row above
+
+worker_buffers = None  # buffers of a worker process of the wavefront pool
+
+
+# Frame, motion vector field, progress of the rows and context states at the lag position. With shared=True the
+# memory is shared with worker processes, which receive the buffers at process start (see init_worker).
+class WavefrontBuffers:
+    def __init__(self, coded_height: int, coded_width: int, block_size: int, num_contexts: int, shared: bool = False):
+        self.block_size = block_size
+        self.num_rows = coded_height // block_size
+        self.blocks_per_row = coded_width // block_size
+        # same layout as PredictionCalculator.mv
+        self.specs = [('frame', (coded_height, coded_width), np.uint8),
+                      ('mv', (self.num_rows + 1, self.blocks_per_row + 2, 2), np.int64),
+                      ('progress', (self.num_rows,), np.int64),
+                      ('contexts', (self.num_rows, num_contexts), np.uint8)]
+        self.raw = [multiprocessing.RawArray('b', int(np.prod(shape)) * np.dtype(dtype).itemsize) if shared
+                    else bytearray(int(np.prod(shape)) * np.dtype(dtype).itemsize)
+                    for _, shape, dtype in self.specs]
+        self.map_arrays()
+
+    def map_arrays(self):
+        for (name, shape, dtype), raw in zip(self.specs, self.raw):
+            setattr(self, name, np.frombuffer(raw, dtype=dtype).reshape(shape))
+
+    # the numpy views are not pickled, the raw arrays are (only possible at process start)
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for name, _, _ in self.specs:
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.map_arrays()
+
+    # start a new frame
+    def reset(self):
+        self.frame.fill(0)
+        self.mv.fill(0)
+        self.progress.fill(0)
+
+    # number of blocks of the row above that have to be finished before block x of a row is coded
+    def required_blocks(self, x_block: int) -> int:
+        return min(x_block + CONTEXT_LAG, self.blocks_per_row)
+
+    def wait_for(self, row: int, num_blocks: int):
+        while self.progress[row] < num_blocks:
+            time.sleep(WAIT_INTERVAL)
+
+    # called after block x of a row is finished, the context states of the row are stored at the lag position
+    def finish_block(self, row: int, x_block: int, context_modeler):
+        if x_block + 1 == self.required_blocks(0):
+            self.contexts[row] = np.frombuffer(context_modeler.saveStates(), dtype=np.uint8)
+        self.progress[row] = x_block + 1
+
+    def wait_for_block(self, row: int, x_block: int):
+        if row > 0:
+            self.wait_for(row - 1, self.required_blocks(x_block))
+
+    # context states for the start of a row (row > 0)
+    def initial_contexts(self, row: int):
+        return self.contexts[row - 1].tobytes()
+
+
+def init_worker(buffers: WavefrontBuffers):
+    global worker_buffers
+    worker_buffers = buffers
+
+
+def create_pool(buffers: WavefrontBuffers, n_workers: int):
+    return ProcessPoolExecutor(n_workers, initializer=init_worker, initargs=(buffers,))
+
+
+# rows coded by each of n_workers workers (interleaved, so all workers follow the wavefront)
+def distribute_rows(num_rows: int, n_workers: int):
+    return [range(worker, num_rows, n_workers) for worker in range(min(n_workers, num_rows))]